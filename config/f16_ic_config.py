@@ -1,7 +1,3 @@
-import matplotlib.pyplot as plt
-import numpy as np
-from scipy.stats import norm
-
 # individual initial conditions for the F16 aircraft - these are the starting values for the simulation
 attitude_ic = {
     "ic/psi-true-deg": 180,  # Heading (degrees)
@@ -58,6 +54,11 @@ type_randomization_variance = {
 }
 
 if __name__ == "__main__":
+    # plotting dependencies are only needed here, importing the config stays cheap for env workers
+    import matplotlib.pyplot as plt
+    import numpy as np
+    from scipy.stats import norm
+
     print("F16 IC Configuration Loaded")
     print("Initial Conditions:", ic)
     print("Type Randomization Variance:", type_randomization_variance)
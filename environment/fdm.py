@@ -5,12 +5,10 @@ from datetime import datetime
 
 import jsbsim
 import numpy as np
-import polars as pl
 
 # Add parent directory to path so we can import from sibling directories
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from config.f16_ic_config import ic, type_randomization_variance
-from utils.plotting import plot_path, plot_trajectory
 
 jsbsim.FGJSBBase().debug_lvl = 0
 
@@ -18,13 +16,117 @@ jsbsim.FGJSBBase().debug_lvl = 0
 DT = 0.1
 RAD2DEG = 180.0 / np.pi
 EARTH_RADIUS = 20925646.3  # Earth radius in feet (mean radius)
+M2FT = 3.2804
+
+# (state key, JSBSim property, scale) for every channel read straight from the property tree.
+# Observed channels come first so the observation is a prefix of the state vector.
+OBSERVED_PROPERTIES = (
+    ("altitude", "atmosphere/density-altitude", 1.0),
+    ("u", "velocities/u-fps", 1.0),
+    ("v", "velocities/v-fps", 1.0),
+    ("w", "velocities/w-fps", 1.0),
+    ("phi", "attitude/phi-deg", 1.0),
+    ("theta", "attitude/theta-deg", 1.0),
+    ("psi", "attitude/psi-deg", 1.0),
+    ("p", "velocities/p-rad_sec", RAD2DEG),
+    ("q", "velocities/q-rad_sec", RAD2DEG),
+    ("r", "velocities/r-rad_sec", RAD2DEG),
+)
+# unobserved channels are stored raw, in JSBSim units; the ft/deg conversions and the local x/y
+# position are derived over whole recorded trajectories by `utils.trajectory.derive_states`
+UNOBSERVED_PROPERTIES = (
+    ("time", "simulation/sim-time-sec", 1.0),
+    ("x-dist-m", "position/distance-from-start-lat-mt", 1.0),
+    ("y-dist-m", "position/distance-from-start-lon-mt", 1.0),
+    ("z", "position/h-agl-ft", 1.0),
+    ("alpha-rad", "aero/alpha-rad", 1.0),
+    ("beta-rad", "aero/beta-rad", 1.0),
+    ("alphadot-rad_sec", "aero/alphadot-rad_sec", 1.0),
+    ("betadot-rad_sec", "aero/betadot-rad_sec", 1.0),
+    ("gamma-rad", "flight-path/gamma-rad", 1.0),
+    ("lat-gc-rad", "position/lat-gc-rad", 1.0),
+    ("long-gc-rad", "position/long-gc-rad", 1.0),
+)
+# channel in ft/deg -> (raw state key, scale), applied after recording or by an observation schema
+UNIT_CONVERSIONS = {
+    "x-dist": ("x-dist-m", M2FT),
+    "y-dist": ("y-dist-m", M2FT),
+    "alpha": ("alpha-rad", RAD2DEG),
+    "beta": ("beta-rad", RAD2DEG),
+    "alphadot": ("alphadot-rad_sec", RAD2DEG),
+    "betadot": ("betadot-rad_sec", RAD2DEG),
+    "gamma": ("gamma-rad", RAD2DEG),
+}
+INPUT_PROPERTIES = (
+    ("aileron", "fcs/aileron-cmd-norm"),
+    ("elevator", "fcs/elevator-cmd-norm"),
+    ("rudder", "fcs/rudder-cmd-norm"),
+    # ("throttle", "fcs/throttle-cmd-norm"),
+)
+
+# every property written by `initialize`, in the order it is written, read by `read_initial_condition`
+IC_PROPERTIES = tuple(name for sub_ic in ic.values() for name in sub_ic)
+
+OBSERVED_KEYS = tuple(key for key, _, _ in OBSERVED_PROPERTIES)
+# full state layout, the observation is its prefix
+STATE_KEYS = OBSERVED_KEYS + tuple(key for key, _, _ in UNOBSERVED_PROPERTIES)
+INPUT_KEYS = tuple(key for key, _ in INPUT_PROPERTIES)
+NUM_OBSERVED = len(OBSERVED_KEYS)
+NUM_STATES = len(STATE_KEYS)
+TIME_INDEX = STATE_KEYS.index("time")
 
 
 class FDM:
-    def __init__(self, aircraft_model):
+    def __init__(self, aircraft_model, physics_substeps=1):
+        """Load `aircraft_model` into a JSBSim executive.
+
+        Args:
+            aircraft_model (str): JSBSim aircraft name, e.g. "f16".
+            physics_substeps (int): JSBSim steps per `propagate_dynamics` call. The JSBSim dt is
+                `DT / physics_substeps`, so a call always advances the simulation by `DT`.
+        """
+        self.aircraft_model = aircraft_model
         self.aircraft = jsbsim.FGFDMExec(None)
         self.aircraft.load_model(aircraft_model)
-        self.aircraft.set_dt(DT)  # Set the simulation time step
+        self.set_physics_substeps(physics_substeps)
+        self._property_manager = self.aircraft.get_property_manager()
+        self._nodes = {}
+        self._read_plans = {}
+        self._resolve_properties()
+
+    def set_physics_substeps(self, physics_substeps):
+        """Set the JSBSim steps per `propagate_dynamics` call, the JSBSim dt becomes `DT / physics_substeps`."""
+        if physics_substeps < 1:
+            raise ValueError(f"physics_substeps must be at least 1, got {physics_substeps}")
+        self.physics_substeps = physics_substeps
+        self.aircraft.set_dt(DT / physics_substeps)  # Set the simulation time step
+
+    def _node(self, name):
+        """Return the cached property node for `name`, resolving it on first use."""
+        node = self._nodes.get(name)
+        if node is None:
+            # create=True matches FGFDMExec.__setitem__/__getitem__, which create missing properties
+            node = self._property_manager.get_node(name, True)
+            self._nodes[name] = node
+        return node
+
+    def _resolve_properties(self):
+        """Resolve every property read or written per step into cached node handles.
+
+        String keyed `self.aircraft[...]` access walks the property tree on every call, so the
+        hot path only goes through the bound getters/setters resolved here.
+        """
+        direct = OBSERVED_PROPERTIES + UNOBSERVED_PROPERTIES
+        self._state_getters = [self._node(prop).get_double_value for _, prop, _ in direct]
+        self._state_scales = np.array([scale for _, _, scale in direct], dtype=np.float64)
+        self._input_getters = [self._node(prop).get_double_value for _, prop in INPUT_PROPERTIES]
+        self._input_setters = [self._node(prop).set_double_value for _, prop in INPUT_PROPERTIES]
+        self._ic_getters = [self._node(name).get_double_value for name in IC_PROPERTIES]
+        self._ic_setters = [self._node(name).set_double_value for name in IC_PROPERTIES]
+
+        # preallocated buffers for the bulk reads
+        self._state = np.zeros(NUM_STATES, dtype=np.float64)
+        self._observation = np.zeros(NUM_OBSERVED, dtype=np.float32)
 
     def configure_turbulence(self, turbulence_strength=15.0, wind_speed=30.0):
         self.aircraft["atmosphere/turb-type"] = 1
@@ -38,15 +140,23 @@ class FDM:
         self.aircraft["atmosphere/turbulence/sigma-v"] = 10.0
         self.aircraft["atmosphere/turbulence/sigma-w"] = 10.0
 
-    def initialize(self, initial_condition, randomization_factor=2.0):
-        """Load initial conditions from a predefined configuration."""
+    def initialize(self, initial_condition, randomization_factor=2.0, rng=None):
+        """Load initial conditions from a predefined configuration.
+
+        Args:
+            initial_condition (dict): Nested initial condition dictionary, mutated in place when randomized.
+            randomization_factor (float): Scale applied to the per-type randomization variance.
+            rng (np.random.Generator, optional): Random generator to draw offsets from, so that
+                vectorized workers can be seeded independently. Defaults to the global numpy state.
+        """
+        normal = np.random.normal if rng is None else rng.normal
 
         if randomization_factor > 0:
             # Randomize initial conditions within a specified range
             for subtype in initial_condition.keys():
                 if subtype in type_randomization_variance.keys():
                     for key in initial_condition[subtype].keys():
-                        random_offset = randomization_factor * np.random.normal(0, type_randomization_variance[subtype])
+                        random_offset = randomization_factor * normal(0, type_randomization_variance[subtype])
                         initial_condition[subtype][key] += random_offset
 
         final_ic = {}
@@ -54,12 +164,50 @@ class FDM:
             final_ic.update(sub_ic)
 
         for ic_name in final_ic.keys():
-            self.aircraft[ic_name] = final_ic[ic_name]
+            self._node(ic_name).set_double_value(final_ic[ic_name])
+
+        self.aircraft.run_ic()
+
+    def read_initial_condition(self):
+        """Read back the initial condition written by the last `initialize`.
+
+        Only the `ic/*` inputs, the JSBSim bindings cannot capture the simulation state after
+        `run_ic`, so `apply_initial_condition` has to run it again.
 
+        Returns:
+            np.ndarray: Values of `IC_PROPERTIES`.
+        """
+        return np.array([getter() for getter in self._ic_getters], dtype=np.float64)
+
+    def apply_initial_condition(self, values):
+        """Write an initial condition read by `read_initial_condition` and run it.
+
+        Skips the nested dict copy and randomization of `initialize` and writes the values
+        straight through the cached handles, `run_ic` itself costs the same.
+        """
+        for setter, value in zip(self._ic_setters, values.tolist()):
+            setter(value)
+        self.aircraft.run_ic()
+
+    def set_initial_condition(self, names, values):
+        """Write a flat initial condition, e.g. a row of an `InitialConditionBank`, and run it.
+
+        Args:
+            names (tuple): Property names, in the order they are written.
+            values (np.ndarray): Values of the properties.
+        """
+        for name, value in zip(names, values.tolist()):
+            self._node(name).set_double_value(value)
         self.aircraft.run_ic()
 
     def propagate_dynamics(self):
-        self.aircraft.run()
+        """Advance the simulation by `DT`, in `physics_substeps` JSBSim steps."""
+        if self.physics_substeps == 1:
+            self.aircraft.run()
+            return
+        run = self.aircraft.run
+        for _ in range(self.physics_substeps):
+            run()
 
     def set_state(self, state):
         """Set the state of the aircraft using a dictionary of state variables.
@@ -71,64 +219,83 @@ class FDM:
         """
         for key, value in state.items():
             if key in self.aircraft:
-                self.aircraft[key] = value
+                self._node(key).set_double_value(value)
             else:
                 raise KeyError(f"State variable '{key}' not found in aircraft model.")
 
-    def get_state_dict(self, exclude=None):
-        def geodetic_to_local(lat_rad, lon_rad):
-            x = EARTH_RADIUS * lon_rad * np.cos(np.radians(lat_rad / 2))
-            y = EARTH_RADIUS * lat_rad
-            return x, y
-
-        x_local, y_local = geodetic_to_local(
-            self.aircraft["position/lat-gc-rad"], self.aircraft["position/long-gc-rad"]
-        )
-        observed_states = {
-            "altitude": self.aircraft["atmosphere/density-altitude"],
-            "u": self.aircraft["velocities/u-fps"],
-            "v": self.aircraft["velocities/v-fps"],
-            "w": self.aircraft["velocities/w-fps"],
-            "phi": self.aircraft["attitude/phi-deg"],
-            "theta": self.aircraft["attitude/theta-deg"],
-            "psi": self.aircraft["attitude/psi-deg"],
-            "p": self.aircraft["velocities/p-rad_sec"] * RAD2DEG,
-            "q": self.aircraft["velocities/q-rad_sec"] * RAD2DEG,
-            "r": self.aircraft["velocities/r-rad_sec"] * RAD2DEG,
-        }
-        unobserved_states = {
-            "time": self.aircraft["simulation/sim-time-sec"],
-            "x-dist": self.aircraft["position/distance-from-start-lat-mt"] * 3.2804,
-            "y-dist": self.aircraft["position/distance-from-start-lon-mt"] * 3.2804,
-            "x": x_local,
-            "y": y_local,
-            "z": self.aircraft["position/h-agl-ft"],
-            "alpha": self.aircraft["aero/alpha-rad"] * RAD2DEG,
-            "beta": self.aircraft["aero/beta-rad"] * RAD2DEG,
-            "alphadot": self.aircraft["aero/alphadot-rad_sec"] * RAD2DEG,
-            "betadot": self.aircraft["aero/betadot-rad_sec"] * RAD2DEG,
-            "gamma": self.aircraft["flight-path/gamma-rad"] * RAD2DEG,
-        }
-        full_state = {**observed_states, **unobserved_states}
-
-        if exclude is not None:
-            for key in exclude:
-                full_state.pop(key, None)
+    def read_state(self, out=None):
+        """Read the full state into a preallocated array laid out as `STATE_KEYS`.
+
+        Only raw property reads and the observation scaling, the derived quantities are left to
+        `utils.trajectory.derive_states`.
+
+        Args:
+            out (np.ndarray, optional): float64 array of length `NUM_STATES` to fill.
+                Defaults to an internal buffer that is overwritten on the next call.
+
+        Returns:
+            np.ndarray: The filled state vector.
+        """
+        if out is None:
+            out = self._state
+        for i, getter in enumerate(self._state_getters):
+            out[i] = getter()
+        np.multiply(out, self._state_scales, out=out)
+        return out
+
+    def read_observation(self, out=None):
+        """Read only the observed channels into a preallocated float32 array.
+
+        Args:
+            out (np.ndarray, optional): float32 array of length `NUM_OBSERVED` to fill.
+                Defaults to an internal buffer that is overwritten on the next call.
 
+        Returns:
+            np.ndarray: The filled observation vector.
+        """
+        if out is None:
+            out = self._observation
+        for i in range(NUM_OBSERVED):
+            out[i] = self._state_getters[i]() * self._state_scales[i]
+        return out
+
+    def read_plan(self, channels, dtype=np.float32):
+        """Compile `channels` (an `ObservationSchema` or its channel list) into a cached `ReadPlan`.
+
+        The plan only reads the properties the channels need, see `environment.observation`.
+        """
+        from environment.observation import ObservationSchema, ReadPlan
+
+        schema = channels if isinstance(channels, ObservationSchema) else ObservationSchema(channels)
+        key = (schema.channels, tuple(schema.properties), np.dtype(dtype))
+        plan = self._read_plans.get(key)
+        if plan is None:
+            getters = [self._node(prop).get_double_value for prop, _ in schema.properties]
+            plan = self._read_plans[key] = ReadPlan(schema, getters, dtype=dtype)
+        return plan
+
+    def get_state_dict(self, exclude=None):
+        """Observed and full state as dicts, excluded keys are not read."""
+        if exclude is None:
+            full_state = dict(zip(STATE_KEYS, self.read_state().tolist()))
+        else:
+            keys = tuple(key for key in STATE_KEYS if key not in exclude)
+            full_state = dict(zip(keys, self.read_plan(keys, dtype=np.float64).read().tolist()))
+        observed_states = {key: full_state[key] for key in OBSERVED_KEYS if key in full_state}
         return observed_states, full_state
 
     def get_observation(self, exclude=None):
         """Get the current observation from the aircraft's state.
 
         Args:
-            exclude (list, optional): List of keys to exclude from the observation.
-                If provided, these keys will be removed from the observation dictionary.
+            exclude (list, optional): Observed keys to leave out, their properties are not read.
 
         Returns:
-            dict: Dictionary containing the current observation state.
+            np.ndarray: Fresh float32 array containing the current observation state.
         """
-        observed_states, _ = self.get_state_dict(exclude=exclude)
-        return np.array(list(observed_states.values()), dtype=np.float32)
+        if exclude is None:
+            return self.read_observation().copy()
+        return self.read_plan(tuple(key for key in OBSERVED_KEYS if key not in exclude)).read().copy()
 
     def set_input(self, action):
         """Set the control inputs for the aircraft based on the action vector.
@@ -145,32 +312,24 @@ class FDM:
             All control inputs are expected to be normalized values that will be
             converted to float and assigned to the aircraft's flight control system.
         """
-        self.aircraft["fcs/aileron-cmd-norm"] = float(action[0])
-        self.aircraft["fcs/elevator-cmd-norm"] = float(action[1])
-        self.aircraft["fcs/rudder-cmd-norm"] = float(action[2])
-        # self.aircraft["fcs/throttle-cmd-norm"] = float(action[3])
+        for setter, value in zip(self._input_setters, action):
+            setter(float(value))
 
     def get_input_dict(self):
         """Get the current control inputs from the aircraft's flight control system."""
-        return {
-            "aileron": self.aircraft["fcs/aileron-cmd-norm"],
-            "elevator": self.aircraft["fcs/elevator-cmd-norm"],
-            "rudder": self.aircraft["fcs/rudder-cmd-norm"],
-            # "throttle": self.aircraft["fcs/throttle-cmd-norm"],
-        }
+        return {key: getter() for key, getter in zip(INPUT_KEYS, self._input_getters)}
 
     def get_input(self):
-        """Get the current control inputs as a list."""
-        return [
-            self.aircraft["fcs/aileron-cmd-norm"],
-            self.aircraft["fcs/elevator-cmd-norm"],
-            self.aircraft["fcs/rudder-cmd-norm"],
-            # self.aircraft["fcs/throttle-cmd-norm"],
-        ].to_numpy(dtype=np.float32)
+        """Get the current control inputs as an array."""
+        return np.array([getter() for getter in self._input_getters], dtype=np.float32)
 
 
 if __name__ == "__main__":
     """Run a simple open loop test of the FlightDynamics class"""
+    import polars as pl
+
+    from utils.plotting import plot_path, plot_trajectory
+
     # Configure logging
     log_filename = f"logs/flight_sim_{datetime.now().strftime('%Y%m%d_%H%M%S')}.log"
     logging.basicConfig(
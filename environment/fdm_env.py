@@ -1,73 +1,278 @@
 import logging
 import os
 import sys
+import uuid
 from datetime import datetime
 
 import gymnasium as gym
 import numpy as np
-import polars as pl
 from gymnasium import spaces
 
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-import pickle
 from copy import deepcopy
 
 from config.f16_ic_config import ic, type_randomization_variance
-from environment.fdm import FDM  # Assuming you have a FlightDynamics class defined
-from environment.reward import MaintainFlight  # Assuming you have a RewardFunction class defined
+from environment import fdm_pool
+from environment.fdm import INPUT_KEYS, NUM_OBSERVED, OBSERVED_KEYS, STATE_KEYS, TIME_INDEX
+from environment.initial_conditions import InitialConditionBank, InitialConditionCache
+from environment.recorder import EpisodeRecorder
+from environment.observation import ObservationSchema
+from environment.reward import (
+    CONSTITUENT_KEYS,
+    MAX_ALTITUDE,
+    MAX_FRAMES,
+    MIN_ALTITUDE,
+    REWARD_CHANNELS,
+    BatchMaintainFlight,
+)
+from utils.profiling import NullTimer, PhaseTimer
+from utils.step_log import AsyncStepLog, step_log_path
+from utils.trajectory_store import TrajectoryStore
 
 ACTION_SCALING = 1.0
+FLUSH_EVERY = 4096  # recorded steps buffered before they are streamed to the trajectory store
+STEP_LOG_MODES = ("structured", "text", "off")
+STEP_LOG_COLUMNS = ("episode", "step", "reward") + tuple(f"action_{key}" for key in INPUT_KEYS)  # + observation
+
+_logging_configured = False
 
-# Configure logging
-log_filename = f"logs/train_sim_{datetime.now().strftime('%Y%m%d_%H%M%S')}.log"
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s - %(levelname)s - %(message)s",
-    handlers=[
-        logging.FileHandler(log_filename),
-    ],
-)
+
+def configure_logging():
+    """Log to `logs/train_sim_<timestamp>.log`, set up once per process on the first recorded episode.
+
+    Deferred so that importing the env, and workers that never record, do not create log files.
+    """
+    global _logging_configured
+    if _logging_configured:
+        return
+    _logging_configured = True
+    log_filename = f"logs/train_sim_{datetime.now().strftime('%Y%m%d_%H%M%S')}.log"
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s - %(levelname)s - %(message)s",
+        handlers=[
+            logging.FileHandler(log_filename),
+        ],
+    )
 
 
 class FDM_env(gym.Env):
-    def __init__(self, evaluation=False, randomization_factor=1.0):
+    def __init__(
+        self,
+        evaluation=False,
+        randomization_factor=1.0,
+        trajectory_store=None,
+        ic_cache_size=0,
+        ic_bank=None,
+        ic_bank_offset=0,
+        ic_bank_stride=1,
+        action_repeat=1,
+        physics_substeps=1,
+        accumulate_reward=False,
+        profile=False,
+        record_every=200,
+        step_log="structured",
+        step_log_every=1,
+        observation_channels=None,
+    ):
+        """Gymnasium environment around the JSBSim F-16 model.
+
+        Args:
+            evaluation (bool): Record and log every episode instead of every 200th.
+            randomization_factor (float): Initial condition randomization, see `FDM.initialize`.
+            trajectory_store (TrajectoryStore, optional): Where recorded episodes are streamed.
+            ic_cache_size (int): When > 0, resets sample from an `InitialConditionCache` of this many
+                randomized initial conditions instead of randomizing a fresh one. Without randomization
+                the cache holds the single nominal initial condition.
+            ic_bank (InitialConditionBank or str, optional): Bank (or path to a saved bank) of precomputed
+                initial conditions. Takes precedence over the cache and the randomization factor: episode n
+                uses row `ic_bank_offset + n * ic_bank_stride` (wrapping), so workers with offset = rank and
+                stride = n_envs consume disjoint rows and evaluation over a fixed bank is reproducible.
+            action_repeat (int): `propagate_dynamics` calls per `step`, holding the action. The observation,
+                reward, logging and done check are only paid once per decision. The episode length limit
+                stays in simulated frames.
+            physics_substeps (int): JSBSim steps per frame, see `FDM`. Smaller JSBSim dt, same frame length.
+            accumulate_reward (bool): Sum the reward of every repeated frame instead of only scoring the
+                last one. Costs an observation read and reward evaluation per skipped frame.
+            profile (bool): Time the phases of `step` and `reset`, collected with `pop_phase_timings`.
+            record_every (int): Record and log every `record_every`-th episode, 0 only records in evaluation.
+            step_log (str): How the steps of recorded episodes are logged. "structured" queues float32
+                rows (episode, step, reward, action, observation) to a background thread writing
+                `logs/step_logs/*.arrow`, dropping rows rather than blocking when it falls behind.
+                "text" writes the historical line per step to the log file, "off" logs no steps.
+            step_log_every (int): Only log every `step_log_every`-th step of a recorded episode.
+            observation_channels (list, optional): Observation channels, see `environment.observation`,
+                e.g. ["altitude", "theta", "phi", "q", "p", "airspeed"]. Only the properties they need,
+                plus those of `REWARD_CHANNELS`, are read per step. Defaults to `OBSERVED_KEYS`.
+        """
+        if action_repeat < 1:
+            raise ValueError(f"action_repeat must be at least 1, got {action_repeat}")
+        if step_log not in STEP_LOG_MODES:
+            raise ValueError(f"step_log must be one of {STEP_LOG_MODES}, got {step_log!r}")
         super(FDM_env, self).__init__()
         self.evaluation = evaluation
         self.randomization_factor = randomization_factor  # Default randomization factor
-        self.fdm = FDM("f16")
+        self.fdm = fdm_pool.take("f16", physics_substeps=physics_substeps)
+        self.action_repeat = action_repeat
+        self.accumulate_reward = accumulate_reward
+        self.timer = PhaseTimer() if profile else NullTimer()
         self.episode_count = -1
+        self.record_every = record_every
         self.last_action = np.zeros(3, dtype=np.float32)
         self.max_action_delta = 0.3  # Maximum change in action per step
         self.logger = logging.getLogger(__name__)
+        self.reward_function = BatchMaintainFlight(n_envs=1)
+        self.step_log = step_log
+        self.step_log_every = step_log_every
+        self._step_log = None
+        self.state_recorder = EpisodeRecorder(STATE_KEYS)
+        self.action_recorder = EpisodeRecorder(INPUT_KEYS)
+        self.reward_recorder = EpisodeRecorder(CONSTITUENT_KEYS)
+        self.recording = False
+        self.trajectory_store = TrajectoryStore() if trajectory_store is None else trajectory_store
+        self._episode_writer = None
+        # episode ids must not collide between envs of one process (train.py's training and eval env)
+        # nor with earlier runs whose process had the same pid
+        self._instance_token = uuid.uuid4().hex[:8]
+        self.ic_cache_size = ic_cache_size
+        self.ic_cache = None
+        self.ic_bank = InitialConditionBank.load(ic_bank) if isinstance(ic_bank, str) else ic_bank
+        self.ic_bank_offset = ic_bank_offset
+        self.ic_bank_stride = ic_bank_stride
+
+        self.observation_channels = OBSERVED_KEYS if observation_channels is None else tuple(observation_channels)
+        self._schema = None
+        self._observation_names = OBSERVED_KEYS
+        if self.observation_channels != OBSERVED_KEYS:
+            # one plan reads the observation and the channels the reward needs, each property once
+            names = self._observation_names = ObservationSchema(self.observation_channels).channels
+            extra = tuple(key for key in REWARD_CHANNELS if key not in names)
+            self._schema = ObservationSchema(self.observation_channels + extra)
+            self._reward_slots = np.array([OBSERVED_KEYS.index(key) for key in REWARD_CHANNELS])
+            self._reward_sources = np.array([(names + extra).index(key) for key in REWARD_CHANNELS])
+            self._reward_observation = np.zeros(NUM_OBSERVED, dtype=np.float32)
+            self._read_plan = self.fdm.read_plan(self._schema)
+        self._step_log_columns = STEP_LOG_COLUMNS + self._observation_names
 
         # Example obs and action spaces (you'll need to define real ones)
-        self.observation_space = spaces.Box(low=-1, high=1, shape=(10,), dtype=np.float32)
+        n_observed = len(self._observation_names)
+        self.observation_space = spaces.Box(low=-1, high=1, shape=(n_observed,), dtype=np.float32)
         self.action_space = spaces.Box(low=-1, high=1, shape=(3,), dtype=np.float32)
 
+    @property
+    def state_history(self):
+        """Recorded states of the last recorded episode as a polars DataFrame."""
+        return self.state_recorder.to_frame()
+
+    @property
+    def action_history(self):
+        """Recorded control inputs of the last recorded episode as a polars DataFrame."""
+        return self.action_recorder.to_frame()
+
+    @property
+    def reward_history(self):
+        """Recorded reward constituents of the last recorded episode as a polars DataFrame."""
+        return self.reward_recorder.to_frame()
+
     def eval_copy(self):
         return FDM_env(
             evaluation=True,
-            randomization_factor=0.0
+            randomization_factor=0.0,
+            action_repeat=self.action_repeat,
+            physics_substeps=self.fdm.physics_substeps,
+            accumulate_reward=self.accumulate_reward,
+            step_log=self.step_log,
+            step_log_every=self.step_log_every,
+            observation_channels=self.observation_channels,
             # etc., depending on your init signature
         )
 
     def reset(self, *, seed=None, options=None):
-        # super().reset(seed=seed)
+        self.timer.start()
+        self._close_episode(terminated=False, truncated=True)  # episode cut short by an external reset
+        super().reset(seed=seed)  # seeds self.np_random, which drives the initial condition randomization
         self.episode_count += 1
-        self.fdm.initialize(deepcopy(ic), randomization_factor=self.randomization_factor)
+        if self.ic_bank is not None:
+            row = (self.ic_bank_offset + self.episode_count * self.ic_bank_stride) % len(self.ic_bank)
+            self.fdm.set_initial_condition(self.ic_bank.names, self.ic_bank.row(row))
+        elif self.ic_cache_size > 0:
+            if self.ic_cache is None or self.ic_cache.randomization_factor != self.randomization_factor:
+                size = self.ic_cache_size if self.randomization_factor > 0 else 1
+                self.ic_cache = InitialConditionCache(
+                    self.fdm, size=size, randomization_factor=self.randomization_factor, rng=self.np_random
+                )
+            self.fdm.apply_initial_condition(self.ic_cache.sample(self.np_random))
+        else:
+            self.fdm.initialize(deepcopy(ic), randomization_factor=self.randomization_factor, rng=self.np_random)
         self.step_count = 0
+        self.frame_count = 0
         self.last_action = np.zeros(3, dtype=np.float32)
-        if self.episode_count % 200 == 0 or self.evaluation:
+        self.reward_function.reset()
+        self.recording = self.evaluation or (self.record_every > 0 and self.episode_count % self.record_every == 0)
+        if self.recording:
+            configure_logging()
+            if self.step_log == "structured" and self._step_log is None:
+                prefix = "eval" if self.evaluation else "train"
+                self._step_log = AsyncStepLog(step_log_path(prefix), self._step_log_columns)
             print(f"Episode {self.episode_count} reset with randomization factor {self.randomization_factor}")
             self.logger.info(
                 f"Episode {self.episode_count} reset with randomization factor {self.randomization_factor}"
             )
-            self.state_history = pl.DataFrame()
-            self.action_history = pl.DataFrame()
-            self.reward_history = pl.DataFrame()
+            # fresh recorders rather than clearing, so references held on the previous episode stay valid
+            self.state_recorder = EpisodeRecorder(STATE_KEYS)
+            self.action_recorder = EpisodeRecorder(INPUT_KEYS)
+            self.reward_recorder = EpisodeRecorder(CONSTITUENT_KEYS)
+            self._flushed = 0
+            kind = "eval" if self.evaluation else "train"
+            self._episode_id = f"{kind}_{os.getpid()}_{self._instance_token}_{self.episode_count:06d}"
+            self._episode_writer = self.trajectory_store.open_episode(
+                self._episode_id, {"state": STATE_KEYS, "action": INPUT_KEYS, "reward": CONSTITUENT_KEYS}
+            )
 
-        return self.fdm.get_observation(), {}
+        observation, _ = self._observe()
+        observation = observation.copy()
+        self.timer.lap("reset")
+        return observation, {}
+
+    def _observe(self, state=None):
+        """Policy observation and the `OBSERVED_KEYS` laid out observation the reward and done check use.
+
+        With the default channels both are the same array. `state`, when already read, saves the reads.
+        """
+        if self._schema is None:
+            observation = self.fdm.read_observation() if state is None else state[:NUM_OBSERVED].astype(np.float32)
+            return observation, observation
+        values = self._read_plan.read()
+        self._reward_observation[self._reward_slots] = values[self._reward_sources]
+        return values[: len(self._observation_names)], self._reward_observation
+
+    def pop_phase_timings(self):
+        """Per phase time totals and counts since the last call, see `utils.profiling.PhaseTimer`."""
+        return self.timer.pop()
+
+    def _flush_recorders(self):
+        """Stream the rows recorded since the last flush to the trajectory store."""
+        self._episode_writer.write("state", self.state_recorder.to_numpy()[self._flushed :])
+        self._episode_writer.write("action", self.action_recorder.to_numpy()[self._flushed :])
+        self._episode_writer.write("reward", self.reward_recorder.to_numpy()[self._flushed :])
+        self._flushed = len(self.state_recorder)
+
+    def _close_episode(self, terminated, truncated):
+        if self._episode_writer is None:
+            return
+        if self._step_log is not None:
+            self._step_log.flush()
+        self._flush_recorders()
+        self.trajectory_store.close_episode(
+            self._episode_id,
+            self._episode_writer,
+            episode_count=self.episode_count,
+            evaluation=self.evaluation,
+            terminated=bool(terminated),
+            truncated=bool(truncated),
+        )
+        self._episode_writer = None
 
     def process_action(self, action):
         action = action * ACTION_SCALING
@@ -77,30 +282,59 @@ class FDM_env(gym.Env):
         return smoothed_action
 
     def step(self, action):
+        timer = self.timer
+        timer.start()
         self.step_count += 1
 
         smoothed_action = self.process_action(action)
         self.fdm.set_input(smoothed_action)
+        timer.lap("action")
 
-        self.fdm.propagate_dynamics()
+        # hold the action for action_repeat frames, only the skipped frames' rewards are computed in the loop.
+        # Accumulated rewards score every frame at its frame index, so the time bonus grows per simulated
+        # frame and the initial penalty is only paid on the first frame of the episode
+        reward = 0.0
+        for frame in range(self.action_repeat):
+            self.fdm.propagate_dynamics()
+            timer.lap("physics")
+            if self.accumulate_reward and frame < self.action_repeat - 1:
+                frame_index = self.frame_count + frame + 1
+                frame_reward, _ = self.get_reward(self.fdm.read_observation(), action, frame_index)
+                reward += frame_reward
+                timer.lap("reward")
+        self.frame_count += self.action_repeat
 
-        obs_dict, full_state = self.fdm.get_state_dict()
-        time = full_state["time"]
-
-        # recover the current state from the flight dynamics model
-        observation = self.fdm.get_observation()
+        # only recorded episodes read the full state, training steps read just the observation plan
+        state = self.fdm.read_state() if self.recording else None
+        observation, reward_observation = self._observe(state)
+        observation = observation.copy()
+        timer.lap("state")
 
         # compute the reward based on the current state and action
-        reward, constituents = self.get_reward(observation, action, self.step_count)
+        reward_index = self.frame_count if self.accumulate_reward else self.step_count
+        frame_reward, constituents = self.get_reward(reward_observation, action, reward_index)
+        reward += frame_reward
+        timer.lap("reward")
 
-        if self.episode_count % 200 == 0 or self.evaluation:
-            self.state_history = pl.concat([self.state_history, pl.DataFrame([full_state])])
-            self.action_history = pl.concat([self.action_history, pl.DataFrame([self.fdm.get_input_dict()])])
-            self.reward_history = pl.concat([self.reward_history, pl.DataFrame([constituents])])
-            self.logger.info(f"Step {self.step_count}:, Reward: {reward}, Action: {action}, Observation: {obs_dict}")
+        if self.recording:
+            self.state_recorder.append(state)
+            self.action_recorder.append(self.fdm.get_input())
+            self.reward_recorder.append(constituents)
+            if len(self.state_recorder) - self._flushed >= FLUSH_EVERY:
+                self._flush_recorders()
+            timer.lap("recording")
+            if self.step_count % self.step_log_every == 0:
+                if self.step_log == "structured":
+                    self._step_log.log(self.episode_count, self.step_count, reward, action, observation)
+                elif self.step_log == "text":
+                    obs_dict = dict(zip(self._observation_names, observation.tolist()))
+                    self.logger.info(
+                        f"Step {self.step_count}:, Reward: {reward}, Action: {action}, Observation: {obs_dict}"
+                    )
+            timer.lap("logging")
 
         # determine if the episode is done
-        terminated, truncated = self.check_done(observation, self.step_count)
+        terminated, truncated = self.check_done(reward_observation, self.frame_count)
 
         # additional info can be returned, e.g., for logging
         info = {
@@ -110,36 +344,50 @@ class FDM_env(gym.Env):
         }
 
         if terminated or truncated:
-            if self.episode_count % 200 == 0 or self.evaluation:
+            if self.recording:
+                time = state[TIME_INDEX]
                 self.logger.info(f"Episode ended: Terminated: {terminated}, Truncated: {truncated}, Time: {time}\n\n\n")
-                # save the state and action history to a pickle file
-                with open(f"logs/state_action_reward_history_episode_{self.episode_count}.pkl", "wb") as f:
-                    pickle.dump(
-                        {"state": self.state_history, "action": self.action_history, "reward": self.reward_history}, f
-                    )
+                # stream the rest of the state, action and reward history to the trajectory store
+                self._close_episode(terminated, truncated)
             info["episode/truncated"] = truncated
             info["episode/terminated"] = terminated
-            info["episode/altitude"] = float(observation[0])
-            info["episode/airspeed"] = float(observation[1])
+            info["episode/altitude"] = float(reward_observation[0])
+            info["episode/airspeed"] = float(reward_observation[1])
             info["episode/total_reward"] = float(reward)
 
+        timer.lap("done")
         return observation, reward, terminated, truncated, info
 
     def get_reward(self, observation, action, step_count):
-        reward = MaintainFlight().get_reward(observation, action, step_count)
-        return reward
+        """Reward of the step and its constituents, ordered as `CONSTITUENT_KEYS`."""
+        total, constituents = self.reward_function.get_rewards(
+            observation[None], np.asarray(action)[None], step_count
+        )
+        return float(total[0]), constituents[0]
 
     def check_done(self, observation, step_count):
         terminated = False
         truncated = False
 
-        if observation[0] < 20 or observation[0] > 1000000:
+        if observation[0] < MIN_ALTITUDE or observation[0] > MAX_ALTITUDE:
             terminated = True
 
-        if step_count > 66666:
+        if step_count > MAX_FRAMES:
             truncated = True
 
         return terminated, truncated
 
     def render(self, mode="human"):
         pass
+
+    def close(self):
+        try:
+            self._close_episode(terminated=False, truncated=True)
+        finally:
+            # stop the step log writer even when flushing the episode raised its error
+            step_log, self._step_log = self._step_log, None
+            if step_log is not None:
+                if step_log.dropped_rows:
+                    self.logger.warning(f"Step log dropped {step_log.dropped_rows} rows")
+                step_log.close()
+            super().close()
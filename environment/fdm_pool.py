@@ -0,0 +1,58 @@
+import multiprocessing as mp
+import os
+
+from environment.fdm import FDM
+
+# comma separated aircraft models loaded when this module is imported, set by `prewarm_workers`
+PREWARM_ENV = "FDM_PREWARM"
+
+_templates = {}  # aircraft model -> FDM loaded in this process or inherited from the forking parent
+_claimed = {}  # aircraft model -> pid of the process that handed its template out
+
+
+def prewarm(aircraft_model="f16"):
+    """Load `aircraft_model` into a template `FDM` of this process.
+
+    Processes forked afterwards inherit the template with its XML already parsed, each as its
+    own copy on write copy of the JSBSim executive.
+    """
+    if aircraft_model not in _templates:
+        _templates[aircraft_model] = FDM(aircraft_model)
+    return _templates[aircraft_model]
+
+
+def take(aircraft_model="f16", physics_substeps=1):
+    """Return an `FDM` of `aircraft_model` ready to be initialized.
+
+    The first call in a process hands out the template that process loaded or inherited from
+    its parent, which skips parsing the aircraft, engine and system XML. Every further call
+    builds a new `FDM`, since two envs can not share one JSBSim executive.
+    """
+    template = _templates.get(aircraft_model)
+    if template is None or _claimed.get(aircraft_model) == os.getpid():
+        return FDM(aircraft_model, physics_substeps=physics_substeps)
+    _claimed[aircraft_model] = os.getpid()
+    template.set_physics_substeps(physics_substeps)
+    return template
+
+
+def prewarm_workers(start_method=None, aircraft_models=("f16",)):
+    """Have the env workers started with `start_method` inherit already loaded aircraft models.
+
+    With "fork" the templates are loaded in this process. With "forkserver" the fork server
+    imports this module with `PREWARM_ENV` set, so it loads every model once and forks all
+    workers from that state. Spawned workers load their own model either way, nothing to do.
+    Call before the vector env starts its workers.
+    """
+    if start_method is None:
+        start_method = "forkserver" if "forkserver" in mp.get_all_start_methods() else "spawn"
+    if start_method == "fork":
+        for aircraft_model in aircraft_models:
+            prewarm(aircraft_model)
+    elif start_method == "forkserver":
+        os.environ[PREWARM_ENV] = ",".join(aircraft_models)
+        mp.set_forkserver_preload([__name__])
+
+
+for _aircraft_model in filter(None, os.environ.get(PREWARM_ENV, "").split(",")):
+    prewarm(_aircraft_model)
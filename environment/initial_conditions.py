@@ -0,0 +1,138 @@
+import os
+import sys
+from copy import deepcopy
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config.f16_ic_config import ic, type_randomization_variance
+
+
+class InitialConditionCache:
+    """Cache of randomized initial conditions, sampled at reset.
+
+    The cache runs the randomized `FDM.initialize` `size` times up front and keeps the
+    `FDM.read_initial_condition` of each, so a reset writes a sampled row through the cached
+    property handles instead of deep copying, randomizing and writing the nested initial
+    condition dictionary. Every reset still pays `run_ic`, and building the cache `size` more.
+
+    Args:
+        fdm (FDM): Flight dynamics model used to resolve the initial conditions.
+        size (int): Number of initial conditions in the cache.
+        randomization_factor (float): Randomization of the initial conditions, see `FDM.initialize`.
+        rng (np.random.Generator, optional): Generator for the randomization.
+        initial_condition (dict): Nominal initial condition to randomize.
+    """
+
+    def __init__(self, fdm, size=256, randomization_factor=2.0, rng=None, initial_condition=ic):
+        if size < 1:
+            raise ValueError(f"InitialConditionCache size must be at least 1, got {size}")
+        self.randomization_factor = randomization_factor
+        conditions = []
+        for _ in range(size):
+            fdm.initialize(deepcopy(initial_condition), randomization_factor=randomization_factor, rng=rng)
+            conditions.append(fdm.read_initial_condition())
+        self.conditions = np.stack(conditions)
+
+    def __len__(self):
+        return len(self.conditions)
+
+    def sample(self, rng):
+        """Return an initial condition drawn uniformly with `rng`."""
+        return self.conditions[rng.integers(len(self.conditions))]
+
+
+def flatten_initial_condition(initial_condition, variance):
+    """Flatten a nested initial condition into property names, nominal values and per property sigma.
+
+    Subtypes without an entry in `variance` are not randomized (sigma 0).
+    """
+    names, nominal, sigma = [], [], []
+    for subtype, sub_ic in initial_condition.items():
+        for name, value in sub_ic.items():
+            names.append(name)
+            nominal.append(value)
+            sigma.append(variance.get(subtype, 0.0))
+    return tuple(names), np.array(nominal, dtype=np.float64), np.array(sigma, dtype=np.float64)
+
+
+class InitialConditionBank:
+    """Precomputed bank of randomized initial conditions, one structured numpy row per reset.
+
+    The bank is sampled in a single vectorized draw with the same distribution as
+    `FDM.initialize` (nominal value plus `randomization_factor * N(0, type variance)` per
+    property). It is persisted with `np.save` and memory mapped on load, so every worker
+    can share one file and a fixed bank makes evaluation reproducible across workers.
+
+    Args:
+        conditions (np.ndarray): Structured array with one float64 field per property name.
+    """
+
+    def __init__(self, conditions):
+        self.conditions = conditions
+        self.names = tuple(conditions.dtype.names)
+
+    @classmethod
+    def generate(
+        cls, n, initial_condition=ic, variance=type_randomization_variance, randomization_factor=2.0, rng=None, seed=None
+    ):
+        """Draw `n` randomized initial conditions.
+
+        Args:
+            n (int): Number of rows.
+            initial_condition (dict): Nested nominal initial condition, e.g. `config.f16_ic_config.ic`.
+            variance (dict): Randomization per subtype, e.g. `config.f16_ic_config.type_randomization_variance`.
+            randomization_factor (float): Scale applied to the variance.
+            rng (np.random.Generator, optional): Generator to draw from, created from `seed` when None.
+            seed (int, optional): Seed of the generator when `rng` is None.
+        """
+        if rng is None:
+            rng = np.random.default_rng(seed)
+        names, nominal, sigma = flatten_initial_condition(initial_condition, variance)
+        values = nominal + randomization_factor * sigma * rng.standard_normal((n, len(names)))
+
+        conditions = np.empty(n, dtype=[(name, np.float64) for name in names])
+        for i, name in enumerate(names):
+            conditions[name] = values[:, i]
+        return cls(conditions)
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        """Load a bank saved with `save`, memory mapped by default."""
+        return cls(np.load(path, mmap_mode="r" if mmap else None))
+
+    def save(self, path):
+        np.save(path, self.conditions)
+
+    def __len__(self):
+        return len(self.conditions)
+
+    def row(self, i):
+        """Values of row `i` in the order of `names`."""
+        return np.array(self.conditions[i].tolist(), dtype=np.float64)
+
+
+if __name__ == "__main__":
+    import argparse
+    import importlib
+
+    parser = argparse.ArgumentParser(description="Generate a bank of randomized initial conditions.")
+    parser.add_argument("--aircraft", default="f16", choices=["f16", "c172"], help="initial condition config to use")
+    parser.add_argument("--n", type=int, default=100_000, help="number of initial conditions")
+    parser.add_argument("--randomization-factor", type=float, default=2.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", default=None, help="output .npy file, defaults to config/<aircraft>_ic_bank.npy")
+    args = parser.parse_args()
+
+    config = importlib.import_module(f"config.{args.aircraft}_ic_config")
+    bank = InitialConditionBank.generate(
+        args.n,
+        initial_condition=config.ic,
+        variance=config.type_randomization_variance,
+        randomization_factor=args.randomization_factor,
+        seed=args.seed,
+    )
+    out = args.out or f"config/{args.aircraft}_ic_bank.npy"
+    bank.save(out)
+    print(f"Saved {len(bank)} initial conditions with {len(bank.names)} properties to {out}")
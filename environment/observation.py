@@ -0,0 +1,95 @@
+import math
+
+import numpy as np
+
+from environment.fdm import EARTH_RADIUS, OBSERVED_PROPERTIES, UNIT_CONVERSIONS, UNOBSERVED_PROPERTIES
+
+# channel name -> (JSBSim property, scale) of every channel read straight from the property tree
+CHANNELS = {key: (prop, scale) for key, prop, scale in OBSERVED_PROPERTIES + UNOBSERVED_PROPERTIES}
+CHANNELS.update(
+    {name: (CHANNELS[raw][0], CHANNELS[raw][1] * scale) for name, (raw, scale) in UNIT_CONVERSIONS.items()}
+)
+
+# channel name -> (input channels, function of the input values), computed from read channels per step
+DERIVED_CHANNELS = {
+    "airspeed": (("u", "v", "w"), lambda u, v, w: math.sqrt(u * u + v * v + w * w)),
+    "x": (("lat-gc-rad", "long-gc-rad"), lambda lat, lon: EARTH_RADIUS * lon * math.cos(math.radians(lat / 2))),
+    "y": (("lat-gc-rad",), lambda lat: EARTH_RADIUS * lat),
+}
+
+
+class ObservationSchema:
+    """Declarative list of observation channels, compiled into the minimal set of property reads.
+
+    A channel is the name of a `CHANNELS` entry (a JSBSim property with its unit conversion),
+    the name of a `DERIVED_CHANNELS` entry, or a `(name, JSBSim property, scale)` tuple for any
+    other property. Every property is read once per step however many channels use it, and
+    properties no channel needs are not read at all.
+
+    Args:
+        channels (iterable): Channels in observation order.
+    """
+
+    def __init__(self, channels):
+        self.channels = []
+        self.properties = []  # (property, scale) read per step, in read order
+        self._direct = []  # (output index, read index)
+        self._derived = []  # (output index, function, read indices)
+        reads = {}
+
+        def read_index(prop, scale):
+            if (prop, scale) not in reads:
+                reads[prop, scale] = len(self.properties)
+                self.properties.append((prop, scale))
+            return reads[prop, scale]
+
+        for index, channel in enumerate(channels):
+            if isinstance(channel, tuple):
+                channel, prop, scale = channel
+                self._direct.append((index, read_index(prop, scale)))
+            elif channel in CHANNELS:
+                self._direct.append((index, read_index(*CHANNELS[channel])))
+            elif channel in DERIVED_CHANNELS:
+                inputs, function = DERIVED_CHANNELS[channel]
+                self._derived.append((index, function, [read_index(*CHANNELS[name]) for name in inputs]))
+            else:
+                raise KeyError(f"Unknown observation channel {channel!r}")
+            self.channels.append(channel)
+        self.channels = tuple(self.channels)
+        # the common case: every channel is its own read, in order
+        self.identity = not self._derived and [read for _, read in self._direct] == list(range(len(self.channels)))
+
+    def __len__(self):
+        return len(self.channels)
+
+    def __repr__(self):
+        return f"ObservationSchema({len(self.channels)} channels, {len(self.properties)} property reads)"
+
+
+class ReadPlan:
+    """An `ObservationSchema` bound to the property nodes of one `FDM`, see `FDM.read_plan`."""
+
+    def __init__(self, schema, getters, dtype=np.float32):
+        self.schema = schema
+        self._getters = getters
+        self._scales = np.array([scale for _, scale in schema.properties], dtype=np.float64)
+        self._raw = np.zeros(len(getters), dtype=np.float64)
+        self._out = np.zeros(len(schema), dtype=dtype)
+        self._direct_out = np.array([index for index, _ in schema._direct], dtype=np.intp)
+        self._direct_read = np.array([read for _, read in schema._direct], dtype=np.intp)
+
+    def read(self, out=None):
+        """Read the channels into a preallocated array, overwritten on the next call unless `out` is given."""
+        if out is None:
+            out = self._out
+        raw = self._raw
+        for i, getter in enumerate(self._getters):
+            raw[i] = getter()
+        np.multiply(raw, self._scales, out=raw)
+        if self.schema.identity:
+            out[:] = raw
+            return out
+        out[self._direct_out] = raw[self._direct_read]
+        for index, function, inputs in self.schema._derived:
+            out[index] = function(*raw[inputs])
+        return out
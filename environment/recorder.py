@@ -0,0 +1,51 @@
+import numpy as np
+
+
+class EpisodeRecorder:
+    """Append-only columnar recorder backed by growable preallocated numpy buffers.
+
+    Rows are written into a (capacity, n_columns) array that doubles when full, so recording
+    an episode is linear in its length. The polars DataFrame is only built when `to_frame`
+    is called and is cached until the next append.
+
+    Args:
+        columns (tuple): Column names, in the order of the values passed to `append`.
+        initial_capacity (int): Number of rows preallocated before the first growth.
+        dtype: numpy dtype of the buffer.
+    """
+
+    def __init__(self, columns, initial_capacity=1024, dtype=np.float64):
+        self.columns = tuple(columns)
+        self._buffer = np.empty((initial_capacity, len(self.columns)), dtype=dtype)
+        self._size = 0
+        self._frame = None
+
+    def __len__(self):
+        return self._size
+
+    def append(self, values):
+        """Append one row, `values` is a sequence or array ordered like `columns`."""
+        if self._size == self._buffer.shape[0]:
+            grown = np.empty((2 * self._buffer.shape[0], self._buffer.shape[1]), dtype=self._buffer.dtype)
+            grown[: self._size] = self._buffer[: self._size]
+            self._buffer = grown
+        self._buffer[self._size] = values
+        self._size += 1
+        self._frame = None
+
+    def clear(self):
+        self._size = 0
+        self._frame = None
+
+    def to_numpy(self):
+        """View of the recorded rows, shape (len(self), len(self.columns))."""
+        return self._buffer[: self._size]
+
+    def to_frame(self):
+        """Build (or return the cached) polars DataFrame of the recorded rows."""
+        if self._frame is None:
+            import polars as pl  # only needed when a recorded episode is inspected
+
+            data = self.to_numpy()
+            self._frame = pl.DataFrame({name: data[:, i] for i, name in enumerate(self.columns)})
+        return self._frame
@@ -1,36 +1,82 @@
 import numpy as np
 
-class MaintainFlight():
-    def __init__(self):
-        self.prev_action = np.zeros(3)
+# order of the reward constituents returned by MaintainFlight.get_reward
+CONSTITUENT_KEYS = ("total", "preservation_bonus", "smoothness_penalty", "control_penalty", "roll_penalty")
 
-    def get_reward(self, observation, action, step_count):
-        altitude = max(0, observation[0])  # Ensure non-negative altitude
-        preservation_bonus = 0.01 + 0.05*step_count + 0.1 * (altitude / 5000)  # Reward for maintaining altitude above 1000 feet  # assuming a baseline reward for maintaining flight
+# observed channels read by BatchMaintainFlight and check_termination, indexed in the OBSERVED_KEYS layout
+REWARD_CHANNELS = ("altitude", "u", "phi")
+
+# termination limits shared by FDM_env.check_done and check_termination
+MIN_ALTITUDE = 20
+MAX_ALTITUDE = 1000000
+MAX_FRAMES = 66666
+
+
+class BatchMaintainFlight():
+    """`MaintainFlight` for `n_envs` environments at once, on (n_envs, obs_dim) arrays.
+
+    Keeps the previous action of every env for the smoothness penalty, call `reset` with the
+    envs starting a new episode.
+    """
+
+    def __init__(self, n_envs=1):
+        self.prev_action = np.zeros((n_envs, 3))
+
+    def reset(self, env_indices=None):
+        """Forget the previous action of `env_indices` (index array or boolean mask), all envs when None."""
+        if env_indices is None:
+            self.prev_action[:] = 0.0
+        else:
+            self.prev_action[env_indices] = 0.0
+
+    def get_rewards(self, observations, actions, step_counts):
+        """Rewards of every env.
+
+        Args:
+            observations (np.ndarray): (n_envs, obs_dim) observations.
+            actions (np.ndarray): (n_envs, 3) actions.
+            step_counts (np.ndarray): (n_envs,) steps into the episode of every env.
+
+        Returns:
+            tuple: (n_envs,) total rewards and the (n_envs, len(CONSTITUENT_KEYS)) constituents.
+        """
+        actions = np.asarray(actions)
+        constituents = np.empty((len(observations), len(CONSTITUENT_KEYS)))
+        total, preservation_bonus, smoothness_penalty, control_penalty, roll_penalty = constituents.T
+
+        altitude = np.maximum(0, observations[:, 0])  # Ensure non-negative altitude
+        preservation_bonus[:] = 0.01 + 0.05 * step_counts + 0.1 * (altitude / 5000)
 
         # Control smoothness penalty (L2 norm of action difference)
-        smoothness_penalty = -3*np.sum((action - self.prev_action) ** 2) # logarithmic penalty for control changes
-        self.prev_action = action.copy()
+        smoothness_penalty[:] = -3 * np.sum((actions - self.prev_action) ** 2, axis=1)
+        self.prev_action[:] = actions
 
         # penalize large control inputs
-        control_penalty = -0.3*np.sum(np.square(action))  # penalize large control inputs
+        control_penalty[:] = -0.3 * np.sum(np.square(actions), axis=1)
 
-        if np.abs(observation[4]) > 120:  # assuming observation[1] is pitch angle in degrees
-            roll_penalty = -0.01 * (np.abs(observation[1]) - 120)  # penalize large roll angles
-        else:
-            roll_penalty = 0.001
+        # the check is on the roll angle, the penalty on observation[1] as in the original reward
+        roll_penalty[:] = np.where(np.abs(observations[:, 4]) > 120, -0.01 * (np.abs(observations[:, 1]) - 120), 0.001)
 
-        if step_count == 1:
-            initial_penalty = -1000
-        else:
-            initial_penalty = 0
-
-        total = preservation_bonus + smoothness_penalty + control_penalty + roll_penalty + initial_penalty
-        constituents = {
-            "total": float(total),
-            "preservation_bonus": float(preservation_bonus),
-            "smoothness_penalty": float(smoothness_penalty),
-            "control_penalty": float(control_penalty),
-            "roll_penalty": float(roll_penalty),
-        }
-        return total, constituents
\ No newline at end of file
+        initial_penalty = np.where(step_counts == 1, -1000, 0)
+
+        total[:] = preservation_bonus + smoothness_penalty + control_penalty + roll_penalty + initial_penalty
+        return total, constituents
+
+
+class MaintainFlight(BatchMaintainFlight):
+    """Single env `BatchMaintainFlight`, with the constituents as a dict."""
+
+    def __init__(self):
+        super().__init__(n_envs=1)
+
+    def get_reward(self, observation, action, step_count):
+        total, constituents = self.get_rewards(observation[None], np.asarray(action)[None], np.array([step_count]))
+        return float(total[0]), dict(zip(CONSTITUENT_KEYS, constituents[0].tolist()))
+
+
+def check_termination(observations, frame_counts):
+    """Vectorized `FDM_env.check_done`, returns the (n_envs,) terminated and truncated flags."""
+    altitude = observations[:, 0]
+    terminated = (altitude < MIN_ALTITUDE) | (altitude > MAX_ALTITUDE)
+    truncated = np.asarray(frame_counts) > MAX_FRAMES
+    return terminated, truncated
@@ -0,0 +1,248 @@
+import multiprocessing as mp
+from multiprocessing import shared_memory
+
+import numpy as np
+from gymnasium import spaces
+from stable_baselines3.common.env_util import is_wrapped
+from stable_baselines3.common.vec_env.base_vec_env import CloudpickleWrapper, VecEnv
+from stable_baselines3.common.vec_env.patch_gym import _patch_env
+
+# commands written to the shared command slot before releasing the workers
+_STEP = 0
+_CONTROL = 1
+_CLOSE = 2
+
+
+def _block_layout(n_envs, obs_shape, action_shape):
+    """Byte offsets of each array in the shared block, each aligned to 8 bytes."""
+    fields = (
+        ("observations", (n_envs, *obs_shape), np.float32),
+        ("actions", (n_envs, *action_shape), np.float32),
+        ("rewards", (n_envs,), np.float32),
+        ("dones", (n_envs,), np.bool_),
+    )
+    layout, offset = [], 0
+    for name, shape, dtype in fields:
+        layout.append((name, shape, dtype, offset))
+        nbytes = int(np.prod(shape)) * np.dtype(dtype).itemsize
+        offset += (nbytes + 7) // 8 * 8
+    return layout, offset
+
+
+def _block_views(buffer, layout):
+    return {name: np.ndarray(shape, dtype=dtype, buffer=buffer, offset=offset) for name, shape, dtype, offset in layout}
+
+
+def _handle_control(env, message):
+    cmd, data = message
+    if cmd == "reset":
+        seed, options = data
+        return env.reset(seed=seed, options=options)
+    if cmd == "get_spaces":
+        return env.observation_space, env.action_space
+    if cmd == "get_attr":
+        return env.get_wrapper_attr(data)
+    if cmd == "set_attr":
+        return env.set_wrapper_attr(*data)
+    if cmd == "env_method":
+        name, args, kwargs = data
+        return env.get_wrapper_attr(name)(*args, **kwargs)
+    if cmd == "is_wrapped":
+        return is_wrapped(env, data)
+    raise NotImplementedError(f"`{cmd}` is not implemented in the worker")
+
+
+def _worker(rank, remote, parent_remote, env_fn_wrapper, command, start_barrier, done_barrier):
+    parent_remote.close()
+    try:
+        env = _patch_env(env_fn_wrapper.var())
+    except BaseException:
+        start_barrier.abort()
+        done_barrier.abort()
+        raise
+    block, views = None, None
+    while True:
+        start_barrier.wait()
+        cmd = command.value
+        try:
+            if cmd == _STEP:
+                obs, reward, terminated, truncated, info = env.step(views["actions"][rank].copy())
+                done = terminated or truncated
+                info["TimeLimit.truncated"] = truncated and not terminated
+                if done:
+                    # infos only cross the pipe at episode boundaries, the per step data stays in shared memory
+                    info["terminal_observation"] = obs
+                    obs, reset_info = env.reset()
+                    remote.send((info, reset_info))
+                views["observations"][rank] = obs
+                views["rewards"][rank] = reward
+                views["dones"][rank] = done
+            elif cmd == _CONTROL and remote.poll():
+                request, data = remote.recv()
+                if request == "attach":
+                    name, layout = data
+                    block = shared_memory.SharedMemory(name=name)
+                    views = _block_views(block.buf, layout)
+                    remote.send((True, None))
+                else:
+                    # errors of control messages are raised in the parent, like AttributeError from get_attr
+                    try:
+                        result = _handle_control(env, (request, data))
+                    except Exception as error:
+                        remote.send((False, error))
+                    else:
+                        if request == "reset":
+                            obs, result = result
+                            views["observations"][rank] = obs
+                        remote.send((True, result))
+            elif cmd == _CLOSE:
+                env.close()
+        except BaseException:
+            # break both barriers so the parent raises BrokenBarrierError instead of hanging
+            start_barrier.abort()
+            done_barrier.abort()
+            raise
+        done_barrier.wait()
+        if cmd == _CLOSE:
+            break
+
+    views = None
+    if block is not None:
+        block.close()
+    remote.close()
+
+
+class SharedMemoryVecEnv(VecEnv):
+    """Multiprocess vector env whose per step data lives in one shared memory block.
+
+    Observations, actions, rewards and done flags of all workers are views into a single
+    shared block. A step writes the actions, releases the workers through a barrier and waits
+    on a second barrier for their results, so nothing is pickled on the hot path. Infos are
+    only sent through the worker pipes when an episode ends, and the pipes also carry the
+    rare control messages (reset with seeds, get_attr, env_method, ...).
+
+    Only Box observation and action spaces are supported. It is a drop-in replacement for
+    `DummyVecEnv`/`SubprocVecEnv`, including automatic resets and `terminal_observation`.
+
+    Args:
+        env_fns (list): Callables that create the environments, one per worker.
+        start_method (str, optional): multiprocessing start method, defaults to forkserver when available.
+    """
+
+    def __init__(self, env_fns, start_method=None):
+        self.waiting = False
+        self.closed = False
+        n_envs = len(env_fns)
+
+        if start_method is None:
+            start_method = "forkserver" if "forkserver" in mp.get_all_start_methods() else "spawn"
+        ctx = mp.get_context(start_method)
+
+        self._command = ctx.RawValue("i", _STEP)
+        self._start_barrier = ctx.Barrier(n_envs + 1)
+        self._done_barrier = ctx.Barrier(n_envs + 1)
+        self.remotes, self.work_remotes = zip(*[ctx.Pipe() for _ in range(n_envs)])
+        self.processes = []
+        for rank, (work_remote, remote, env_fn) in enumerate(zip(self.work_remotes, self.remotes, env_fns)):
+            args = (
+                rank,
+                work_remote,
+                remote,
+                CloudpickleWrapper(env_fn),
+                self._command,
+                self._start_barrier,
+                self._done_barrier,
+            )
+            process = ctx.Process(target=_worker, args=args, daemon=True)
+            process.start()
+            self.processes.append(process)
+            work_remote.close()
+
+        observation_space, action_space = self._control([0], ("get_spaces", None))[0]
+        for space in (observation_space, action_space):
+            if not isinstance(space, spaces.Box):
+                raise ValueError(f"SharedMemoryVecEnv only supports Box spaces, got {space}")
+
+        layout, nbytes = _block_layout(n_envs, observation_space.shape, action_space.shape)
+        self._block = shared_memory.SharedMemory(create=True, size=nbytes)
+        self._views = _block_views(self._block.buf, layout)
+        self._control(range(n_envs), ("attach", (self._block.name, layout)))
+
+        super().__init__(n_envs, observation_space, action_space)
+
+    def _control(self, indices, message):
+        """Send `message` to the workers in `indices` and return their replies."""
+        indices = list(indices)
+        for i in indices:
+            self.remotes[i].send(message)
+        self._command.value = _CONTROL
+        self._start_barrier.wait()
+        self._done_barrier.wait()
+        results = []
+        for i in indices:
+            ok, result = self.remotes[i].recv()
+            if not ok:
+                raise result
+            results.append(result)
+        return results
+
+    def reset(self):
+        for i, remote in enumerate(self.remotes):
+            remote.send(("reset", (self._seeds[i], self._options[i])))
+        self._command.value = _CONTROL
+        self._start_barrier.wait()
+        self._done_barrier.wait()
+        self.reset_infos = []
+        for remote in self.remotes:
+            ok, result = remote.recv()
+            if not ok:
+                raise result
+            self.reset_infos.append(result)
+        self._reset_seeds()
+        self._reset_options()
+        return self._views["observations"].copy()
+
+    def step_async(self, actions):
+        self._views["actions"][:] = np.asarray(actions, dtype=np.float32).reshape(self._views["actions"].shape)
+        self._command.value = _STEP
+        self._start_barrier.wait()
+        self.waiting = True
+
+    def step_wait(self):
+        self._done_barrier.wait()
+        self.waiting = False
+        dones = self._views["dones"].copy()
+        infos = [{} for _ in range(self.num_envs)]
+        for i in np.flatnonzero(dones):
+            infos[i], self.reset_infos[i] = self.remotes[i].recv()
+        return self._views["observations"].copy(), self._views["rewards"].copy(), dones, infos
+
+    def close(self):
+        if self.closed:
+            return
+        if self.waiting:
+            self._done_barrier.wait()
+        self._command.value = _CLOSE
+        self._start_barrier.wait()
+        self._done_barrier.wait()
+        for process in self.processes:
+            process.join()
+        self._views = None
+        self._block.close()
+        self._block.unlink()
+        self.closed = True
+
+    def get_images(self):
+        raise NotImplementedError("SharedMemoryVecEnv does not support rendering")
+
+    def get_attr(self, attr_name, indices=None):
+        return self._control(self._get_indices(indices), ("get_attr", attr_name))
+
+    def set_attr(self, attr_name, value, indices=None):
+        self._control(self._get_indices(indices), ("set_attr", (attr_name, value)))
+
+    def env_method(self, method_name, *method_args, indices=None, **method_kwargs):
+        return self._control(self._get_indices(indices), ("env_method", (method_name, method_args, method_kwargs)))
+
+    def env_is_wrapped(self, wrapper_class, indices=None):
+        return self._control(self._get_indices(indices), ("is_wrapped", wrapper_class))
@@ -0,0 +1,234 @@
+import os
+import sys
+import time
+
+import numpy as np
+from gymnasium import spaces
+from stable_baselines3.common.vec_env.base_vec_env import VecEnv
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from environment.fdm import INPUT_KEYS, NUM_OBSERVED, OBSERVED_KEYS
+from environment.fdm_env import ACTION_SCALING
+from environment.reward import BatchMaintainFlight, check_termination
+
+MAX_ACTION_DELTA = 0.3  # as FDM_env.max_action_delta
+PSI_INDEX = OBSERVED_KEYS.index("psi")
+# the heading wraps at 360 degrees, it is integrated but not used as a regressor
+FEATURE_INDEX = np.array([i for i in range(NUM_OBSERVED) if i != PSI_INDEX])
+
+
+class SurrogateDynamics:
+    """Linear surrogate of the F-16 dynamics over one 0.1 s frame, fit from recorded `FDM` trajectories.
+
+    The change of the observation is a linear function of the observation (without the
+    heading), the applied control inputs and a bias, fit by least squares over every recorded
+    transition. Stepping is one matrix product for the whole batch of aircraft.
+
+    Args:
+        weights (np.ndarray): (len(FEATURE_INDEX) + len(INPUT_KEYS) + 1, NUM_OBSERVED) regression weights.
+        initial_observations (np.ndarray): (n, NUM_OBSERVED) first observations of the recorded
+            episodes, resets sample from them.
+    """
+
+    def __init__(self, weights, initial_observations):
+        self.weights = weights
+        self.initial_observations = initial_observations
+
+    @staticmethod
+    def features(observations, inputs):
+        return np.concatenate(
+            [observations[:, FEATURE_INDEX], inputs, np.ones((len(observations), 1))], axis=1
+        )
+
+    def step(self, observations, inputs):
+        """Advance (n, NUM_OBSERVED) observations by one frame under (n, len(INPUT_KEYS)) inputs."""
+        next_observations = observations + self.features(observations, inputs) @ self.weights
+        next_observations[:, PSI_INDEX] %= 360.0
+        return next_observations
+
+    @staticmethod
+    def transitions(store, episode_ids=None):
+        """(features, observation deltas, first observations) of every recorded episode of `store`.
+
+        The action row recorded at step i + 1 holds the inputs applied to go from state row i to i + 1.
+        """
+        if episode_ids is None:
+            index = store.index()
+            episode_ids = index["episode_id"].to_list() if len(index) else []
+        features, deltas, initial = [], [], []
+        for episode_id in episode_ids:
+            states = store.read_episode(episode_id, "state", list(OBSERVED_KEYS)).to_numpy()
+            inputs = store.read_episode(episode_id, "action", list(INPUT_KEYS)).to_numpy()
+            if len(states) < 2:
+                continue
+            delta = states[1:] - states[:-1]
+            delta[:, PSI_INDEX] = (delta[:, PSI_INDEX] + 180.0) % 360.0 - 180.0
+            features.append(SurrogateDynamics.features(states[:-1], inputs[1:]))
+            deltas.append(delta)
+            initial.append(states[0])
+        if not features:
+            raise ValueError(f"No episodes with at least two recorded steps in {store.root}")
+        return np.concatenate(features), np.concatenate(deltas), np.stack(initial)
+
+    @classmethod
+    def fit(cls, store, episode_ids=None):
+        """Least squares fit on the episodes of a `TrajectoryStore`, returns the model and the R² per observation."""
+        features, deltas, initial = cls.transitions(store, episode_ids)
+        weights, *_ = np.linalg.lstsq(features, deltas, rcond=None)
+        residual = deltas - features @ weights
+        r2 = 1.0 - residual.var(axis=0) / np.maximum(deltas.var(axis=0), 1e-12)
+        return cls(weights, initial), dict(zip(OBSERVED_KEYS, r2.tolist()))
+
+    def save(self, path):
+        np.savez(path, weights=self.weights, initial_observations=self.initial_observations)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(data["weights"], data["initial_observations"])
+
+
+class SurrogateVecEnv(VecEnv):
+    """`n_envs` surrogate aircraft stepped together as arrays, with the spaces, reward and done rules of `FDM_env`.
+
+    Actions go through the same scaling and rate limit as `FDM_env.process_action`, rewards
+    and termination use `BatchMaintainFlight` and `check_termination`. Finished envs are reset
+    in place to a sampled recorded start observation, their info carries the
+    `terminal_observation` and a Monitor style `episode` entry, so SB3 logs the episode return
+    and length without a `Monitor` wrapper.
+
+    Args:
+        dynamics (SurrogateDynamics or str): Fitted model or path to a saved one.
+        n_envs (int): Number of aircraft.
+        seed (int, optional): Seed of the start observation sampling.
+    """
+
+    def __init__(self, dynamics, n_envs=1, seed=None):
+        self.dynamics = SurrogateDynamics.load(dynamics) if isinstance(dynamics, str) else dynamics
+        self.render_mode = None
+        super().__init__(
+            n_envs,
+            spaces.Box(low=-1, high=1, shape=(NUM_OBSERVED,), dtype=np.float32),
+            spaces.Box(low=-1, high=1, shape=(len(INPUT_KEYS),), dtype=np.float32),
+        )
+        self.rng = np.random.default_rng(seed)
+        self.observations = np.zeros((n_envs, NUM_OBSERVED))
+        self.last_action = np.zeros((n_envs, len(INPUT_KEYS)))
+        self.step_counts = np.zeros(n_envs, dtype=np.int64)
+        self.episode_returns = np.zeros(n_envs)
+        self.episode_counts = np.full(n_envs, -1)
+        self.reward_function = BatchMaintainFlight(n_envs)
+        self._actions = None
+        self._start_time = time.time()
+
+    def _reset_envs(self, env_indices):
+        rows = self.rng.integers(len(self.dynamics.initial_observations), size=len(env_indices))
+        self.observations[env_indices] = self.dynamics.initial_observations[rows]
+        self.last_action[env_indices] = 0.0
+        self.step_counts[env_indices] = 0
+        self.episode_returns[env_indices] = 0.0
+        self.episode_counts[env_indices] += 1
+        self.reward_function.reset(env_indices)
+
+    def reset(self):
+        if self._seeds[0] is not None:
+            self.rng = np.random.default_rng(self._seeds[0])
+        self._reset_seeds()
+        self._reset_options()
+        self._reset_envs(np.arange(self.num_envs))
+        return self.observations.astype(np.float32)
+
+    def step_async(self, actions):
+        self._actions = np.asarray(actions, dtype=np.float64).reshape(self.num_envs, -1)
+
+    def step_wait(self):
+        actions = self._actions
+        self.last_action += np.clip(actions * ACTION_SCALING - self.last_action, -MAX_ACTION_DELTA, MAX_ACTION_DELTA)
+        self.observations = self.dynamics.step(self.observations, self.last_action)
+        self.step_counts += 1
+
+        observations = self.observations.astype(np.float32)
+        diverged = ~np.isfinite(observations).all(axis=1)
+        if diverged.any():
+            # a diverging surrogate ends the episode without poisoning the normalization statistics
+            observations[diverged] = np.nan_to_num(observations[diverged], nan=0.0, posinf=0.0, neginf=0.0)
+        rewards, _ = self.reward_function.get_rewards(observations, actions, self.step_counts)
+        terminated, truncated = check_termination(observations, self.step_counts)
+        terminated |= diverged
+        dones = terminated | truncated
+        self.episode_returns += rewards
+
+        infos = [{} for _ in range(self.num_envs)]
+        done_indices = np.flatnonzero(dones)
+        for i in done_indices:
+            infos[i] = {
+                "terminated": bool(terminated[i]),
+                "truncated": bool(truncated[i]),
+                "episode_count": int(self.episode_counts[i]),
+                "TimeLimit.truncated": bool(truncated[i] and not terminated[i]),
+                "terminal_observation": observations[i],
+                "episode": {
+                    "r": float(self.episode_returns[i]),
+                    "l": int(self.step_counts[i]),
+                    "t": round(time.time() - self._start_time, 6),
+                },
+            }
+        if len(done_indices):
+            self._reset_envs(done_indices)
+            observations[done_indices] = self.observations[done_indices]
+        return observations, rewards.astype(np.float32), dones, infos
+
+    def close(self):
+        pass
+
+    def get_attr(self, attr_name, indices=None):
+        return [getattr(self, attr_name)] * len(self._get_indices(indices))
+
+    def set_attr(self, attr_name, value, indices=None):
+        setattr(self, attr_name, value)
+
+    def env_method(self, method_name, *method_args, indices=None, **method_kwargs):
+        raise NotImplementedError("The surrogate aircraft are arrays, there are no per env methods")
+
+    def env_is_wrapped(self, wrapper_class, indices=None):
+        return [False] * len(self._get_indices(indices))
+
+
+def collect(store, n_episodes, max_steps=2000, randomization_factor=2.0, seed=0):
+    """Fly `n_episodes` JSBSim episodes with random actions and record them to `store` for fitting."""
+    from environment.fdm_env import FDM_env
+
+    env = FDM_env(randomization_factor=randomization_factor, trajectory_store=store, record_every=1, step_log="off")
+    rng = np.random.default_rng(seed)
+    env.reset(seed=seed)
+    for episode in range(n_episodes):
+        for _ in range(max_steps):
+            _, _, terminated, truncated, _ = env.step(rng.uniform(-1, 1, len(INPUT_KEYS)).astype(np.float32))
+            if terminated or truncated:
+                break
+        if episode < n_episodes - 1:
+            env.reset()  # also closes an episode cut at max_steps
+    env.close()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from utils.trajectory_store import TrajectoryStore
+
+    parser = argparse.ArgumentParser(description="Fit the linear surrogate dynamics from recorded FDM trajectories.")
+    parser.add_argument("--trajectories", default="logs/trajectories", help="TrajectoryStore root to fit on")
+    parser.add_argument("--collect", type=int, default=0, help="first record this many random action episodes")
+    parser.add_argument("--max-steps", type=int, default=2000, help="longest collected episode")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", default="config/f16_surrogate.npz")
+    args = parser.parse_args()
+
+    store = TrajectoryStore(args.trajectories)
+    if args.collect:
+        collect(store, args.collect, max_steps=args.max_steps, seed=args.seed)
+    model, r2 = SurrogateDynamics.fit(store)
+    model.save(args.out)
+    print("R² of the per frame change:", ", ".join(f"{key} {value:.3f}" for key, value in r2.items()))
+    print(f"Surrogate with {len(model.initial_observations)} start observations saved to {args.out}")
@@ -0,0 +1,265 @@
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config.f16_ic_config import ic
+from environment.fdm import FDM
+from environment.fdm_env import FDM_env
+from environment.initial_conditions import InitialConditionBank
+from environment.reward import BatchMaintainFlight, MaintainFlight, check_termination
+from utils.trajectory_store import TrajectoryStore
+
+RESULTS_DIR = "benchmarks"
+# env worker import paths and the heavy modules they must not pull in
+IMPORT_TARGETS = ("environment.fdm", "environment.fdm_env")
+HEAVY_MODULES = ("matplotlib", "scipy", "polars", "pyarrow", "PyQt5", "torch", "stable_baselines3")
+IMPORT_BUDGET_S = 1.0
+
+
+def summarize(durations_ns):
+    """Throughput and latency statistics of per call durations in nanoseconds."""
+    durations_us = np.asarray(durations_ns, dtype=np.float64) / 1e3
+    total_s = durations_us.sum() / 1e6
+    return {
+        "calls": int(len(durations_us)),
+        "total_s": float(total_s),
+        "per_sec": float(len(durations_us) / total_s) if total_s > 0 else float("inf"),
+        "mean_us": float(durations_us.mean()),
+        "p50_us": float(np.percentile(durations_us, 50)),
+        "p99_us": float(np.percentile(durations_us, 99)),
+    }
+
+
+def time_calls(fn, n, warmup=100):
+    """Call `fn` `n` times after `warmup` untimed calls and summarize the per call durations."""
+    for _ in range(warmup):
+        fn()
+    durations = np.empty(n, dtype=np.int64)
+    clock = time.perf_counter_ns
+    for i in range(n):
+        start = clock()
+        fn()
+        durations[i] = clock() - start
+    return summarize(durations)
+
+
+def bench_fdm(n):
+    fdm = FDM("f16")
+    fdm.initialize(dict((k, dict(v)) for k, v in ic.items()), randomization_factor=0.0)
+    action = np.zeros(3, dtype=np.float32)
+    reward = MaintainFlight()
+    observation = fdm.get_observation()
+
+    def propagate(n):
+        """Only `propagate_dynamics` is timed, the crash check and re-initialization are not."""
+        fdm.set_input(action)
+        durations = np.empty(n, dtype=np.int64)
+        clock = time.perf_counter_ns
+        for i in range(n):
+            start = clock()
+            fdm.propagate_dynamics()
+            durations[i] = clock() - start
+            # keep the aircraft flying, the crash state is not representative
+            if fdm.read_observation()[0] < 100:
+                fdm.initialize(dict((k, dict(v)) for k, v in ic.items()), randomization_factor=0.0)
+        return summarize(durations)
+
+    propagate(100)  # warmup
+    return {
+        "fdm.propagate_dynamics": propagate(n),
+        "fdm.get_state_dict": time_calls(fdm.get_state_dict, n),
+        "fdm.get_observation": time_calls(fdm.get_observation, n),
+        "fdm.read_state": time_calls(fdm.read_state, n),
+        "fdm.read_plan[6 channels]": time_calls(fdm.read_plan(("altitude", "theta", "phi", "p", "q", "r")).read, n),
+        "reward.get_reward": time_calls(lambda: reward.get_reward(observation, action, 10), n),
+    }
+
+
+def bench_batch_reward(n, n_envs):
+    """Reward and termination of `n_envs` envs in one call, per call throughput."""
+    rng = np.random.default_rng(0)
+    observations = rng.normal(0, 100, (n_envs, 10)).astype(np.float32)
+    actions = rng.uniform(-1, 1, (n_envs, 3)).astype(np.float32)
+    step_counts = np.full(n_envs, 10)
+    reward = BatchMaintainFlight(n_envs)
+
+    def evaluate():
+        reward.get_rewards(observations, actions, step_counts)
+        check_termination(observations, step_counts)
+
+    return time_calls(evaluate, n)
+
+
+def benchmark_env_kwargs(root):
+    """`FDM_env` kwargs keeping benchmark episodes out of logs/, recorded ones go to the temporary store `root`."""
+    return {"trajectory_store": TrajectoryStore(root), "record_every": 0, "step_log": "off"}
+
+
+def bench_env(n, recording):
+    with tempfile.TemporaryDirectory() as root:
+        env = FDM_env(evaluation=recording, randomization_factor=0.0, **benchmark_env_kwargs(root))
+        env.reset(seed=0)
+        action = np.zeros(3, dtype=np.float32)
+        durations = np.empty(n, dtype=np.int64)
+        clock = time.perf_counter_ns
+        for i in range(n):
+            start = clock()
+            _, _, terminated, truncated, _ = env.step(action)
+            durations[i] = clock() - start
+            if terminated or truncated:
+                env.reset()
+        env.close()
+    return summarize(durations)
+
+
+def bench_reset(n, source="initialize"):
+    """Randomized resets, the initial condition drawn by `initialize`, from an `ic_cache` or an `ic_bank`.
+
+    The cache is built by the untimed first reset.
+    """
+    reset_kwargs = {}
+    if source == "ic_cache":
+        reset_kwargs["ic_cache_size"] = 256
+    elif source == "ic_bank":
+        reset_kwargs["ic_bank"] = InitialConditionBank.generate(n + 10, seed=0)
+    with tempfile.TemporaryDirectory() as root:
+        env = FDM_env(randomization_factor=2.0, **reset_kwargs, **benchmark_env_kwargs(root))
+        env.reset(seed=0)
+        result = time_calls(lambda: env.reset(), n, warmup=5)
+        env.close()
+    return result
+
+
+def bench_vec_env(n, n_envs, backend):
+    from stable_baselines3.common.vec_env import VecNormalize
+
+    from scripts.train import make_vec_env
+
+    with tempfile.TemporaryDirectory() as log_dir:
+        # keep the Monitor files of the benchmark out of training_logs/
+        env_kwargs = benchmark_env_kwargs(log_dir)
+        env = VecNormalize(
+            make_vec_env("benchmark", n_envs=n_envs, seed=0, backend=backend, env_kwargs=env_kwargs, log_dir=log_dir)
+        )
+        env.reset()
+        actions = np.zeros((n_envs, 3), dtype=np.float32)
+        result = time_calls(lambda: env.step(actions), n, warmup=10)
+        env.close()
+    result["env_steps_per_sec"] = result["per_sec"] * n_envs
+    return result
+
+
+def bench_import(module, repeats=5):
+    """Import `module` in fresh interpreters, returns the best wall time and the heavy modules it loaded."""
+    code = (
+        "import sys, time\n"
+        "start = time.perf_counter()\n"
+        f"import {module}\n"
+        "elapsed = time.perf_counter() - start\n"
+        f"heavy = [m for m in {HEAVY_MODULES!r} if m in sys.modules]\n"
+        "print(elapsed, ','.join(heavy))\n"
+    )
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    times = []
+    for _ in range(repeats):
+        out = subprocess.check_output([sys.executable, "-c", code], cwd=root, text=True).split()
+        times.append(float(out[0]))
+    return {"seconds": min(times), "heavy_modules": out[1].split(",") if len(out) > 1 else []}
+
+
+def check_imports(budget_s):
+    """Time the env import paths against `budget_s`, returns the failures."""
+    failures = []
+    results = {}
+    for module in IMPORT_TARGETS:
+        result = results[module] = bench_import(module)
+        status = "ok"
+        if result["seconds"] > budget_s or result["heavy_modules"]:
+            status = "FAIL"
+            failures.append(module)
+        heavy = f"  loads {', '.join(result['heavy_modules'])}" if result["heavy_modules"] else ""
+        print(f"import {module:33s} {result['seconds'] * 1e3:9.1f} ms  budget {budget_s * 1e3:.0f} ms  {status}{heavy}")
+    return results, failures
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def compare(baseline, results):
+    """Print the throughput ratio of every benchmark present in both result sets."""
+    print(f"{'benchmark':40s} {'baseline/s':>14s} {'current/s':>14s} {'ratio':>8s}")
+    for name, current in results["benchmarks"].items():
+        if name not in baseline["benchmarks"]:
+            continue
+        before = baseline["benchmarks"][name]["per_sec"]
+        print(f"{name:40s} {before:14.1f} {current['per_sec']:14.1f} {current['per_sec'] / before:8.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Throughput benchmarks of the FDM and environment hot paths.")
+    parser.add_argument("--n", type=int, default=20_000, help="timed calls per micro benchmark")
+    parser.add_argument("--n-resets", type=int, default=200, help="timed resets")
+    parser.add_argument("--n-envs", type=int, nargs="*", default=[1, 2, 4, 8], help="worker counts for vec stepping")
+    parser.add_argument("--backend", default="shm", choices=["shm", "subproc"], help="vector env backend")
+    parser.add_argument("--out", default=None, help="output json, defaults to benchmarks/<commit>.json")
+    parser.add_argument("--compare", default=None, help="baseline json to compare the results against")
+    parser.add_argument(
+        "--imports-only", action="store_true", help="only check the env import time budget, exit 1 when exceeded"
+    )
+    parser.add_argument("--import-budget", type=float, default=IMPORT_BUDGET_S, help="env import budget in seconds")
+    args = parser.parse_args()
+
+    imports, import_failures = check_imports(args.import_budget)
+    if args.imports_only:
+        sys.exit(1 if import_failures else 0)
+
+    benchmarks = {}
+    benchmarks.update(bench_fdm(args.n))
+    for n_envs in args.n_envs:
+        benchmarks[f"reward.get_rewards[n_envs={n_envs}]"] = bench_batch_reward(args.n, n_envs)
+    benchmarks["env.step"] = bench_env(args.n, recording=False)
+    benchmarks["env.step_recording"] = bench_env(args.n, recording=True)
+    benchmarks["env.reset"] = bench_reset(args.n_resets)
+    benchmarks["env.reset[ic_cache]"] = bench_reset(args.n_resets, "ic_cache")
+    benchmarks["env.reset[ic_bank]"] = bench_reset(args.n_resets, "ic_bank")
+    for n_envs in args.n_envs:
+        benchmarks[f"vec_env.step[{args.backend},n_envs={n_envs}]"] = bench_vec_env(
+            max(args.n // n_envs, 100), n_envs, args.backend
+        )
+
+    commit = git_commit()
+    results = {
+        "commit": commit,
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "benchmarks": benchmarks,
+        "imports": imports,
+    }
+    out = args.out or os.path.join(RESULTS_DIR, f"{commit}.json")
+    os.makedirs(os.path.dirname(out) or ".", exist_ok=True)
+    with open(out, "w") as f:
+        json.dump(results, f, indent=2)
+
+    for name, result in benchmarks.items():
+        print(f"{name:40s} {result['per_sec']:12.1f}/s  p50 {result['p50_us']:9.1f} us  p99 {result['p99_us']:9.1f} us")
+    print(f"Results saved to {out}")
+
+    if args.compare is not None:
+        with open(args.compare) as f:
+            compare(json.load(f), results)
@@ -1,67 +1,316 @@
+import argparse
+import glob
+import itertools
+import json
+import multiprocessing as mp
 import os
+import queue
 import random
 import sys
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+from functools import lru_cache
 
 import numpy as np
+import polars as pl
 import torch
-from icecream import ic
-from stable_baselines3 import PPO
-from stable_baselines3.common.vec_env import DummyVecEnv, VecNormalize
 
 os.environ["QT_QPA_PLATFORM"] = "offscreen"
 
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
+from environment.fdm import STATE_KEYS, TIME_INDEX
 from environment.fdm_env import FDM_env
-from utils.plotting import plot_path, plot_trajectory
+from utils.inference_server import InferenceServer, sb3_policy
+from utils.model_registry import MODEL_DIR, ModelRegistry, env_kwargs, evaluation_condition, load_model, rank_value
+from utils.policy_runtime import NumpyPolicy
 
-# change model meta to the model you want to evaluate
-model_meta = "a=0.0002, gamma=0.99"
 SEED = 666
+ALTITUDE_INDEX = STATE_KEYS.index("altitude")
 
-np.random.seed(SEED)  # Set the random seed for reproducibility
-torch.manual_seed(SEED)  # Set the random seed for PyTorch
-random.seed(SEED)  # Set the random seed for the random module
 
+def find_models(patterns, registry, best=None, key="score", condition=None):
+    """Resolve glob patterns to (name, model zip, normalize pkl, env settings) of every registered `*_best` model.
 
-def make_env(seed, eval=False):
-    def _init():
-        env = FDM_env(evaluation=eval, randomization_factor=0.0)  # Create the environment
-        # env.reset(seed=seed)  # Optional but helpful to trigger RNG
-        # env.action_space.seed(seed)
-        # env.observation_space.seed(seed)
-        return env
+    The env settings are the json of the `FDM_env` kwargs the model was trained with (observation
+    channels, action repeat, ...), so the episodes are flown in a matching env.
 
-    return _init
+    The registry is updated first, which only opens new or changed models. Models without saved
+    `VecNormalize` statistics are skipped. With `best`, only the `best` matching models with the
+    highest manifest `key` are returned, best first, scores and evaluated returns being those
+    recorded under the evaluation `condition`. Raises ValueError if no matching model has a `key`.
+    """
+    registry.update()
+    selected = {os.path.normpath(path) for pattern in patterns for path in glob.glob(pattern, recursive=True)}
+    entries = []
+    for entry in registry.models.values():
+        if os.path.normpath(os.path.dirname(entry["model_path"])) not in selected:
+            continue
+        if entry["normalize_path"] is None:
+            print(f"Skipping {entry['name']}: no normalization statistics")
+            continue
+        entries.append(entry)
+    if best is not None and entries:
+        ranked = [entry for entry in entries if rank_value(entry, key, condition) is not None]
+        if not ranked:
+            raise ValueError(
+                f"None of the {len(entries)} matching models has a {key}: scores are the returns of earlier "
+                "evaluate.py runs with the same --seeds and --randomization-factors, or the EvalCallback reward "
+                "of `train.py --run-dir` runs. Evaluate them without --best first."
+            )
+        entries = sorted(ranked, key=lambda entry: rank_value(entry, key, condition), reverse=True)[:best]
+    return [
+        (entry["name"], entry["model_path"], entry["normalize_path"], json.dumps(entry.get("env", {}), sort_keys=True))
+        for entry in entries
+    ]
 
 
-# Create a vectorized environment for evaluation
-vec_eval_env = DummyVecEnv([make_env(SEED, eval=True)])  # 1 env for evaluation
-vecnorm_eval_env = VecNormalize.load(
-    f"models/{model_meta}_normalize.pkl", vec_eval_env
-)  # Load the normalization statistics
-vecnorm_eval_env.training = False  # Set the environment to evaluation mode
-vecnorm_eval_env.norm_reward = False  # Disable reward normalization for evaluation
-vecnorm_eval_env.seed(SEED)  # Set the seed for reproducibility
-vecnorm_eval_env.venv.seed(SEED)  # Set the seed for the vectorized environment
-inner_env = vecnorm_eval_env.venv.envs[0]  # Get the inner environment
-# inner_env.randomization_factor = 0  # Set the randomization factor to 0 for evaluation
+def _init_worker():
+    torch.set_num_threads(1)  # many episode workers, one thread each
 
-model = PPO.load(
-    f"models/{model_meta}_best/best_model", env=vecnorm_eval_env, device="cpu"
-)  # Load the trained PPO model
 
-# Load normalization statistics
-obs = vecnorm_eval_env.reset()  # Reset the environment to get the initial observation
+def exported_path(model_path):
+    """Path of the numpy policy `utils.policy_export` writes next to a `best_model.zip`."""
+    return os.path.join(os.path.dirname(model_path), "policy.npz")
 
-done = False
-while not done:
-    sh = inner_env.state_history
-    ah = inner_env.action_history
-    rh = inner_env.reward_history
 
-    action, states = model.predict(obs, deterministic=True)  # Predict the action using the model
-    obs, rewards, done, info = vecnorm_eval_env.step(action)
+@lru_cache(maxsize=8)
+def load_exported(model_path):
+    return NumpyPolicy(exported_path(model_path))
 
-plot_trajectory(sh, ah, rh)
-plot_path(sh, interactive=False)
+
+def load_policy(model_path, normalize_path):
+    """Load a model and its observation statistics once per worker process."""
+    return load_model(model_path, normalize_path)
+
+
+@lru_cache(maxsize=4)
+def episode_env(env_settings="{}"):
+    """One `FDM_env` per worker process and env settings, reused by every episode it flies through `reset(seed=...)`."""
+    return FDM_env(record_every=0, **env_kwargs(json.loads(env_settings)))
+
+
+def fly_episode(predict, seed, randomization_factor, env_settings="{}"):
+    """Fly one deterministic episode in an env with `env_settings`, `predict` maps a raw observation to an action."""
+    env = episode_env(env_settings)
+    env.randomization_factor = randomization_factor
+    observation, _ = env.reset(seed=seed)
+    # altitude from the FDM, the observation holds whichever channels the model was trained on
+    initial_altitude = altitude = float(env.fdm.read_state()[ALTITUDE_INDEX])
+    min_altitude = initial_altitude
+    episode_return = 0.0
+    terminated = truncated = False
+    while not (terminated or truncated):
+        observation, reward, terminated, truncated, _ = env.step(predict(observation))
+        episode_return += float(reward)
+        state = env.fdm.read_state()
+        altitude = float(state[ALTITUDE_INDEX])
+        min_altitude = min(min_altitude, altitude)
+    flight_time = float(state[TIME_INDEX])
+    return {
+        "randomization_factor": randomization_factor,
+        "seed": seed,
+        "return": episode_return,
+        "flight_time": flight_time,
+        "steps": env.step_count,
+        "altitude_loss": initial_altitude - altitude,
+        "min_altitude": min_altitude,
+        "terminated": bool(terminated),
+    }
+
+
+def run_episode(name, model_path, normalize_path, env_settings, seed, randomization_factor, exported=False):
+    """Fly one episode with the worker's own copy of the model and return its summary statistics."""
+    if exported:
+        summary = fly_episode(load_exported(model_path), seed, randomization_factor, env_settings)
+        return {"model": name, **summary}
+    policy = sb3_policy(*load_policy(model_path, normalize_path))
+    summary = fly_episode(lambda observation: policy(observation[None])[0], seed, randomization_factor, env_settings)
+    return {"model": name, **summary}
+
+
+def _batched_worker(client, name, env_settings, tasks, results):
+    """Fly `tasks` (seed, randomization factor) with actions from a shared `InferenceServer`.
+
+    A failing episode puts an `{"error": traceback}` row, so the parent does not wait for its results.
+    """
+    try:
+        for seed, randomization_factor in tasks:
+            results.put({"model": name, **fly_episode(client.predict, seed, randomization_factor, env_settings)})
+    except Exception:
+        results.put({"error": traceback.format_exc()})
+        raise
+    finally:
+        client.close()
+
+
+def _collect_results(name, results, n_results, workers, poll_interval=1.0):
+    """`n_results` rows from the batched workers, raising as soon as one of them failed or died."""
+    rows = []
+    while len(rows) < n_results:
+        try:
+            row = results.get(timeout=poll_interval)
+        except queue.Empty:
+            # a worker killed without reaching its except clause (e.g. by a signal) never reports
+            dead = [worker.exitcode for worker in workers if worker.exitcode not in (None, 0)]
+            if not dead:
+                continue
+            error = f"{len(dead)} evaluation worker(s) of {name} died with exit code {dead[0]}"
+        else:
+            if "error" not in row:
+                rows.append(row)
+                continue
+            error = f"Evaluation worker of {name} failed:\n{row['error']}"
+        for worker in workers:
+            worker.terminate()
+            worker.join()
+        raise RuntimeError(error)
+    return rows
+
+
+def evaluate_batched(models, seeds, randomization_factors, n_workers, max_batch=256, max_wait=0.002):
+    """Like `evaluate`, but the workers only step envs and one batched policy per model serves them all."""
+    tasks = list(itertools.product(seeds, randomization_factors))
+    start_method = "forkserver" if "forkserver" in mp.get_all_start_methods() else "spawn"
+    ctx = mp.get_context(start_method)
+    rows = []
+    for name, model_path, normalize_path, env_settings in models:
+        chunks = [chunk for chunk in np.array_split(np.arange(len(tasks)), n_workers) if len(chunk)]
+        server = InferenceServer(
+            sb3_policy(*load_policy(model_path, normalize_path)),
+            n_clients=len(chunks),
+            max_batch=max_batch,
+            max_wait=max_wait,
+            context=ctx,
+        ).start()
+        results = ctx.Queue()
+        workers = [
+            ctx.Process(
+                target=_batched_worker,
+                args=(server.client(i), name, env_settings, [tasks[j] for j in chunk], results),
+            )
+            for i, chunk in enumerate(chunks)
+        ]
+        for worker in workers:
+            worker.start()
+        rows.extend(_collect_results(name, results, len(tasks), workers))
+        server.join()
+        for worker in workers:
+            worker.join()
+        print(f"{name}: {len(tasks)} episodes, mean policy batch size {server.mean_batch_size:.1f}")
+    return pl.DataFrame(rows)
+
+
+def evaluate(models, seeds, randomization_factors, n_workers, exported=False):
+    """Run every (model, randomization factor, seed) episode in parallel worker processes.
+
+    With `exported`, the workers run the numpy policies written by `utils.policy_export`
+    instead of loading the models with torch.
+    """
+    tasks = list(itertools.product(models, randomization_factors, seeds))
+    start_method = "forkserver" if "forkserver" in mp.get_all_start_methods() else "spawn"
+    rows = []
+    with ProcessPoolExecutor(n_workers, mp_context=mp.get_context(start_method), initializer=_init_worker) as pool:
+        futures = [pool.submit(run_episode, *model, seed, factor, exported) for model, factor, seed in tasks]
+        for i, future in enumerate(as_completed(futures), start=1):
+            rows.append(future.result())
+            print(f"\r{i}/{len(tasks)} episodes", end="", flush=True)
+    print()
+    return pl.DataFrame(rows)
+
+
+def summarize(episodes):
+    """Aggregate the episodes per model and randomization factor."""
+    return (
+        episodes.group_by("model", "randomization_factor")
+        .agg(
+            pl.len().alias("episodes"),
+            pl.col("return").mean().alias("return_mean"),
+            pl.col("return").std().alias("return_std"),
+            pl.col("return").quantile(0.1).alias("return_p10"),
+            pl.col("return").median().alias("return_median"),
+            pl.col("return").quantile(0.9).alias("return_p90"),
+            pl.col("flight_time").mean().alias("flight_time_mean"),
+            pl.col("flight_time").min().alias("flight_time_min"),
+            pl.col("altitude_loss").mean().alias("altitude_loss_mean"),
+            pl.col("terminated").mean().alias("crash_rate"),
+        )
+        .sort(["randomization_factor", "flight_time_mean"], descending=[False, True])
+    )
+
+
+def plot_episode(model_path, normalize_path, env_settings, seed, randomization_factor):
+    """Fly one recorded episode in process and plot it like the original single model evaluation."""
+    from utils.plotting import plot_path, plot_trajectory
+
+    np.random.seed(seed)  # Set the random seed for reproducibility
+    torch.manual_seed(seed)  # Set the random seed for PyTorch
+    random.seed(seed)  # Set the random seed for the random module
+
+    policy = sb3_policy(*load_policy(model_path, normalize_path))
+    env = FDM_env(evaluation=True, randomization_factor=randomization_factor, **env_kwargs(json.loads(env_settings)))
+    observation, _ = env.reset(seed=seed)
+    terminated = truncated = False
+    while not (terminated or truncated):
+        observation, _, terminated, truncated, _ = env.step(policy(observation[None])[0])
+    env.close()
+    plot_trajectory(env.state_history, env.action_history, env.reward_history)
+    plot_path(env.state_history, interactive=False)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Evaluate trained models over many seeds in parallel.")
+    parser.add_argument(
+        "--models", nargs="+", default=["models/**/*_best"], help="glob patterns of `*_best` model directories"
+    )
+    parser.add_argument("--registry", default=MODEL_DIR, help="root of the model registry the patterns select from")
+    parser.add_argument("--best", type=int, default=None, help="only evaluate the N best registered models")
+    parser.add_argument("--rank-by", default="score", help="manifest field --best ranks by, e.g. num_timesteps")
+    parser.add_argument("--seeds", type=int, nargs="+", default=[SEED])
+    parser.add_argument("--randomization-factors", type=float, nargs="+", default=[0.0])
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="parallel episode workers")
+    parser.add_argument("--out", default=None, help="episode csv, defaults to logs/evaluation_<timestamp>.csv")
+    parser.add_argument(
+        "--batched-inference", action="store_true", help="serve one batched policy per model to all workers"
+    )
+    parser.add_argument(
+        "--exported", action="store_true", help="run the exported numpy policies (<model>_best/policy.npz)"
+    )
+    parser.add_argument("--max-batch", type=int, default=256, help="largest policy batch with --batched-inference")
+    parser.add_argument("--max-wait", type=float, default=0.002, help="seconds a request waits for its batch")
+    parser.add_argument("--plot", action="store_true", help="also plot the first episode of the first model")
+    args = parser.parse_args()
+
+    registry = ModelRegistry(args.registry)
+    condition = evaluation_condition(args.seeds, args.randomization_factors)
+    try:
+        models = find_models(args.models, registry, args.best, args.rank_by, condition)
+    except ValueError as error:
+        sys.exit(str(error))
+    if not models:
+        sys.exit(f"No models with normalization statistics match {args.models}")
+
+    if args.batched_inference:
+        episodes = evaluate_batched(
+            models, args.seeds, args.randomization_factors, args.workers, args.max_batch, args.max_wait
+        )
+    else:
+        if args.exported:
+            missing = [model_path for _, model_path, _, _ in models if not os.path.exists(exported_path(model_path))]
+            if missing:
+                sys.exit(f"No exported policy for {missing}, run `python utils/policy_export.py <model>_best` first")
+        episodes = evaluate(models, args.seeds, args.randomization_factors, args.workers, args.exported)
+    out = args.out or f"logs/evaluation_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
+    os.makedirs(os.path.dirname(out) or ".", exist_ok=True)
+    episodes.write_csv(out)
+    returns = episodes.group_by("model").agg(pl.col("return").mean())
+    registry.record_returns(dict(zip(returns["model"], returns["return"])), condition)
+
+    with pl.Config(tbl_rows=-1, tbl_cols=-1, tbl_width_chars=200, float_precision=1):
+        print(summarize(episodes))
+    print(f"Episode results saved to {out}")
+
+    if args.plot:
+        _, model_path, normalize_path, env_settings = models[0]
+        plot_episode(model_path, normalize_path, env_settings, args.seeds[0], args.randomization_factors[0])
@@ -0,0 +1,248 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+import psutil
+import yaml
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scripts.train import run_paths
+from utils.pruning import PRUNE_WARMUP, PRUNED_MARKER, PRUNERS
+
+STATE_FILE = "sweep_state.json"
+TRAIN_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "train.py")
+
+
+def finished_marker_path(run_dir, subconfig):
+    """The `VecNormalize` statistics train.py saves once training ends, which mark a finished run.
+
+    `_best` is already written at the first evaluation, so it does not tell a finished run from
+    an interrupted one.
+    """
+    return os.path.join(run_paths(run_dir)["models"], f"{subconfig}_normalize.pkl")
+
+
+def core_slots(core_budget, cores_per_run):
+    """Split the first `core_budget` usable cores into disjoint sets of `cores_per_run` cores."""
+    if hasattr(os, "sched_getaffinity"):
+        cores = sorted(os.sched_getaffinity(0))
+    else:
+        cores = list(range(os.cpu_count() or 1))
+    cores = cores[:core_budget]
+    n_slots = max(len(cores) // cores_per_run, 1)
+    return [cores[i * cores_per_run : (i + 1) * cores_per_run] or cores for i in range(n_slots)]
+
+
+class Sweep:
+    """Runs the top level configs of a ppo config concurrently under a core budget.
+
+    Every run is a `train.py --subconfig <name> --run-dir <sweep_dir>/<name>` subprocess, pinned
+    to its own set of cores with one torch/BLAS thread, so runs neither share output
+    directories nor oversubscribe the machine. The status of every run is kept in
+    `<sweep_dir>/sweep_state.json`: restarting an interrupted sweep resumes the runs that did not
+    finish, and runs that already saved their normalization statistics (the last
+    thing train.py writes) are skipped.
+
+    With `prune`, every run reports its evaluation rewards to `<sweep_dir>/pruning/` and stops
+    early when it falls behind the other runs (median rule or successive halving, see
+    `utils.pruning`). The cores of a stopped run go to the next queued run or, when the queue
+    is empty, are added to the affinity of the runs still training.
+
+    Args:
+        config_path (str): ppo config whose top level entries are the runs.
+        sweep_dir (str): Root directory of the sweep outputs.
+        core_budget (int): Number of cores the sweep may use.
+        n_envs (int): Env workers per run.
+        cores_per_run (int, optional): Cores pinned to each run, defaults to `n_envs`.
+        train_args (list): Extra command line arguments passed to every `train.py`.
+        prune (str, optional): Pruning rule, "median" or "halving".
+        prune_warmup (float): Fraction of the training steps of a run before it may be pruned.
+    """
+
+    def __init__(
+        self,
+        config_path,
+        sweep_dir,
+        core_budget,
+        n_envs=1,
+        cores_per_run=None,
+        train_args=(),
+        prune=None,
+        prune_warmup=PRUNE_WARMUP,
+    ):
+        self.config_path = os.path.abspath(config_path)
+        self.sweep_dir = os.path.abspath(sweep_dir)
+        self.n_envs = n_envs
+        self.train_args = list(train_args)
+        if prune is not None:
+            self.train_args += ["--prune", prune, "--pruning-dir", os.path.join(self.sweep_dir, "pruning")]
+            self.train_args += ["--prune-warmup", str(prune_warmup)]
+        self.slots = core_slots(core_budget, cores_per_run or n_envs)
+        with open(config_path, "r") as f:
+            self.subconfigs = list(yaml.load(f, Loader=yaml.FullLoader).keys())
+        os.makedirs(sweep_dir, exist_ok=True)
+        self.state = self._load_state()
+        self.running = {}  # subconfig -> (process, slot index, log file)
+
+    @property
+    def state_path(self):
+        return os.path.join(self.sweep_dir, STATE_FILE)
+
+    def _load_state(self):
+        if os.path.exists(self.state_path):
+            with open(self.state_path, "r") as f:
+                return json.load(f)
+        return {}
+
+    def _save_state(self):
+        tmp_path = self.state_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.state, f, indent=2)
+        os.replace(tmp_path, self.state_path)
+
+    def _set_status(self, subconfig, status, **fields):
+        entry = self.state.setdefault(subconfig, {})
+        entry.update(status=status, updated=datetime.now().isoformat(timespec="seconds"), **fields)
+        self._save_state()
+
+    def run_dir(self, subconfig):
+        return os.path.join(self.sweep_dir, subconfig)
+
+    def pending(self):
+        """Runs still to train, in config order."""
+        pending = []
+        for subconfig in self.subconfigs:
+            status = self.state.get(subconfig, {}).get("status")
+            if os.path.exists(finished_marker_path(self.run_dir(subconfig), subconfig)):
+                if status not in ("done", "skipped", "pruned"):
+                    self._set_status(subconfig, "skipped", reason="run already finished")
+                continue
+            if status in ("done", "pruned"):
+                continue
+            # running (the sweep itself was killed), interrupted, failed or never started
+            pending.append(subconfig)
+        return pending
+
+    def _launch(self, subconfig, slot):
+        cores = self.slots[slot]
+        run_dir = self.run_dir(subconfig)
+        os.makedirs(run_dir, exist_ok=True)
+        command = [
+            sys.executable,
+            TRAIN_SCRIPT,
+            "--config",
+            self.config_path,
+            "--subconfig",
+            subconfig,
+            "--run-dir",
+            run_dir,
+            "--n-envs",
+            str(self.n_envs),
+            "--torch-threads",
+            "1",
+            *self.train_args,
+        ]
+        env = {**os.environ, "OMP_NUM_THREADS": "1", "MKL_NUM_THREADS": "1", "OPENBLAS_NUM_THREADS": "1"}
+        preexec_fn = (lambda: os.sched_setaffinity(0, cores)) if hasattr(os, "sched_setaffinity") else None
+        log_file = open(os.path.join(run_dir, "train.out"), "a")
+        process = subprocess.Popen(
+            command,
+            stdout=log_file,
+            stderr=subprocess.STDOUT,
+            env=env,
+            preexec_fn=preexec_fn,
+            cwd=os.path.dirname(os.path.dirname(TRAIN_SCRIPT)),
+        )
+        self.running[subconfig] = (process, slot, log_file)
+        self._set_status(subconfig, "running", pid=process.pid, cores=cores)
+        print(f"[sweep] started {subconfig} on cores {cores}")
+
+    def _reap(self):
+        """Collect finished runs, returns the slots they freed."""
+        freed = []
+        for subconfig, (process, slot, log_file) in list(self.running.items()):
+            returncode = process.poll()
+            if returncode is None:
+                continue
+            log_file.close()
+            del self.running[subconfig]
+            freed.append(slot)
+            if returncode != 0:
+                status = "failed"
+            elif os.path.exists(os.path.join(self.run_dir(subconfig), PRUNED_MARKER)):
+                status = "pruned"
+            else:
+                status = "done"
+            self._set_status(subconfig, status, returncode=returncode)
+            print(f"[sweep] {subconfig} {status} (exit code {returncode})")
+        return freed
+
+    def _donate(self, cores):
+        """Spread `cores` over the running runs by widening the affinity of their whole process tree."""
+        if not hasattr(os, "sched_setaffinity"):
+            return
+        runs = list(self.running.items())
+        for i, (subconfig, (process, slot, log_file)) in enumerate(runs):
+            extra = cores[i :: len(runs)]
+            if not extra:
+                continue
+            self.slots[slot] = sorted(set(self.slots[slot]) | set(extra))
+            try:
+                parent = psutil.Process(process.pid)
+                for member in [parent, *parent.children(recursive=True)]:
+                    member.cpu_affinity(self.slots[slot])
+            except psutil.NoSuchProcess:
+                continue
+            self._set_status(subconfig, "running", cores=self.slots[slot])
+            print(f"[sweep] {subconfig} now on cores {self.slots[slot]}")
+
+    def run(self, poll_interval=5.0):
+        queue = self.pending()
+        free_slots = list(range(len(self.slots)))
+        n_skipped = len(self.subconfigs) - len(queue)
+        print(f"[sweep] {len(queue)} runs to train on {len(self.slots)} slots, {n_skipped} skipped")
+        try:
+            while queue or self.running:
+                while queue and free_slots:
+                    self._launch(queue.pop(0), free_slots.pop(0))
+                time.sleep(poll_interval)
+                free_slots.extend(self._reap())
+                if not queue and free_slots and self.running:
+                    self._donate([core for slot in free_slots for core in self.slots[slot]])
+                    free_slots = []
+        except KeyboardInterrupt:
+            for subconfig, (process, _, log_file) in self.running.items():
+                process.terminate()
+                process.wait()
+                log_file.close()
+                self._set_status(subconfig, "interrupted")
+            raise
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Train every top level config of a ppo config concurrently.",
+        epilog="Arguments after `--` are passed to every train.py, e.g. `-- --vec-env subproc --profile`.",
+    )
+    parser.add_argument("--config", default="config/ppo_config.yaml", help="ppo config file")
+    parser.add_argument("--sweep-dir", default=None, help="output root, defaults to sweeps/<config name>")
+    parser.add_argument("--cores", type=int, default=os.cpu_count(), help="core budget of the sweep")
+    parser.add_argument("--n-envs", type=int, default=1, help="env workers per run")
+    parser.add_argument("--cores-per-run", type=int, default=None, help="cores pinned per run, defaults to n-envs")
+    parser.add_argument("--prune", choices=sorted(PRUNERS), default=None, help="stop runs that fall behind early")
+    parser.add_argument(
+        "--prune-warmup", type=float, default=PRUNE_WARMUP, help="fraction of a run's steps trained before pruning"
+    )
+    args, train_args = parser.parse_known_args()
+    if train_args and train_args[0] == "--":
+        train_args = train_args[1:]
+
+    sweep_dir = args.sweep_dir or os.path.join("sweeps", os.path.splitext(os.path.basename(args.config))[0])
+    Sweep(
+        args.config, sweep_dir, args.cores, args.n_envs, args.cores_per_run, train_args, args.prune, args.prune_warmup
+    ).run()
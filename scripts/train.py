@@ -1,66 +1,311 @@
+import argparse
 import os
 import sys
 
+import torch
 import yaml
 from stable_baselines3 import PPO
-from stable_baselines3.common.callbacks import EvalCallback
+from stable_baselines3.common.callbacks import CallbackList, EvalCallback
 from stable_baselines3.common.monitor import Monitor
-from stable_baselines3.common.vec_env import DummyVecEnv, VecNormalize
+from stable_baselines3.common.vec_env import DummyVecEnv, SubprocVecEnv, VecNormalize
 
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from environment.fdm_env import FDM_env  # Assuming you have a custom environment defined in jsbsim_env.py
+from environment import fdm_pool
+from environment.fdm_env import STEP_LOG_MODES, FDM_env  # Assuming you have a custom environment defined in jsbsim_env.py
+from environment.shm_vec_env import SharedMemoryVecEnv
+from environment.surrogate import SurrogateVecEnv
+from utils.callbacks import PhaseTimingCallback
+from utils.pruning import PRUNE_WARMUP, PRUNERS, PruningCallback, TrialReports, make_pruner
+from utils.model_registry import save_env_settings
+from utils.trajectory_store import TrajectoryStore
 
+VEC_ENV_BACKENDS = {"subproc": SubprocVecEnv, "shm": SharedMemoryVecEnv}
+# `FDM_env` settings the eval env shares with the training env
+EVAL_ENV_KWARGS = ("action_repeat", "physics_substeps", "accumulate_reward", "observation_channels")
 
-def train(algo, subconfig):
-    with open("config/ppo_config.yaml", "r") as f:
+
+def make_env(rank, subconfig, n_envs=1, log_dir="training_logs", **env_kwargs):
+    """Build the factory for one training worker.
+
+    Each worker owns its own FDM and writes its own Monitor file, so that parallel workers
+    never share a JSBSim instance or interleave rows in the same csv.
+
+    Args:
+        rank (int): Index of the worker in the vectorized environment.
+        subconfig (str): Name of the ppo config, used to name the Monitor log.
+        n_envs (int): Total number of workers. A single worker keeps the historical log name.
+        log_dir (str): Directory of the Monitor files.
+        **env_kwargs: Passed to `FDM_env`, `randomization_factor` defaults to 2.0. With an
+            `ic_bank`, worker `rank` consumes the rows rank, rank + n_envs, ...
+    """
+    env_kwargs = {"randomization_factor": 2.0, **env_kwargs}
+    if env_kwargs.get("ic_bank") is not None:
+        env_kwargs.update(ic_bank_offset=rank, ic_bank_stride=n_envs)
+
+    def _init():
+        suffix = "" if n_envs == 1 else f"_{rank}"
+        return Monitor(
+            FDM_env(**env_kwargs),
+            filename=os.path.join(log_dir, f"{subconfig}_log{suffix}.csv"),
+            info_keywords=("terminated", "truncated", "episode_count"),
+        )
+
+    return _init
+
+
+def make_vec_env(
+    subconfig,
+    n_envs=1,
+    seed=0,
+    start_method=None,
+    backend="shm",
+    env_kwargs=None,
+    log_dir="training_logs",
+    prewarm=True,
+):
+    """Create the training vector env, using subprocess workers when `n_envs > 1`.
+
+    Workers are seeded with `seed + rank` on their first reset, which drives the
+    initial condition randomization of each worker independently.
+
+    Args:
+        backend (str): "shm" exchanges the per step data through shared memory,
+            "subproc" uses the pipe based `SubprocVecEnv`.
+        env_kwargs (dict, optional): Passed to every `FDM_env`.
+        log_dir (str): Directory of the Monitor files.
+        prewarm (bool): Load the aircraft once before starting the workers, which inherit it
+            instead of each parsing the JSBSim XML (fork and forkserver start methods).
+    """
+    env_fns = [
+        make_env(rank, subconfig, n_envs=n_envs, log_dir=log_dir, **(env_kwargs or {})) for rank in range(n_envs)
+    ]
+    if n_envs == 1:
+        vec_env = DummyVecEnv(env_fns)
+    else:
+        if prewarm:
+            fdm_pool.prewarm_workers(start_method)
+        vec_env = VEC_ENV_BACKENDS[backend](env_fns, start_method=start_method)
+    vec_env.seed(seed)
+    return vec_env
+
+
+def run_paths(run_dir=None):
+    """Output directories of a training run.
+
+    Without `run_dir` these are the historical shared directories, with it every output of the
+    run (models, eval logs, tensorboard, Monitor files and recorded trajectories) is isolated
+    under `run_dir`, which is what the sweep runner uses.
+    """
+    if run_dir is None:
+        return {
+            "models": "models",
+            "logs": "logs",
+            "tensorboard": "./ppo_jsbsim_tensorboard/",
+            "monitor": "training_logs",
+        }
+    return {
+        "models": os.path.join(run_dir, "models"),
+        "logs": os.path.join(run_dir, "logs"),
+        "tensorboard": os.path.join(run_dir, "tensorboard"),
+        "monitor": os.path.join(run_dir, "training_logs"),
+    }
+
+
+def train(
+    algo,
+    subconfig,
+    n_envs=1,
+    seed=0,
+    start_method=None,
+    backend="shm",
+    env_kwargs=None,
+    config_path="config/ppo_config.yaml",
+    run_dir=None,
+    total_timesteps=1_000_00,
+    callbacks=None,
+    prune=None,
+    pruning_dir=None,
+    prune_warmup=PRUNE_WARMUP,
+    surrogate=None,
+    pretrained=None,
+):
+    """Train `algo` with the ppo config `subconfig` and keep its best model and normalization statistics.
+
+    Args:
+        prune_warmup (float): Fraction of `total_timesteps` trained before `prune` may stop the run.
+        surrogate (str, optional): Saved `SurrogateDynamics`, trains on `n_envs` surrogate aircraft
+            stepped as arrays instead of JSBSim workers. Evaluation stays on JSBSim.
+        pretrained (str, optional): `<prefix>_best` directory of a model (and its `<prefix>_normalize.pkl`)
+            to continue training from, e.g. a surrogate pretrained model fine-tuned on JSBSim.
+    """
+    with open(config_path, "r") as f:
         config = yaml.load(f, Loader=yaml.FullLoader)
 
-    ppo_kwargs = config.get(subconfig, {})
-    print(ppo_kwargs)
-
-    train_env = DummyVecEnv(
-        [
-            lambda: Monitor(
-                FDM_env(randomization_factor=2.0),
-                filename=f"training_logs/{subconfig}_log.csv",
-                info_keywords=("terminated", "truncated", "episode_count"),
-            )
-        ]  # Wrap the environment in a Monitor for logging
-    )  # Wrap the environment in a DummyVecEnv for vectorized trainin
-    env = VecNormalize(train_env, norm_obs=True, norm_reward=True)  # Normalize observations and rewards
-
-    eval_env = DummyVecEnv([lambda: FDM_env()])  # Create a vectorized environment for evaluation
+    ppo_kwargs = dict(config.get(subconfig, {}))
+    n_envs = ppo_kwargs.pop("n_envs", n_envs)
+    print(ppo_kwargs, f"n_envs={n_envs}")
+
+    paths = run_paths(run_dir)
+    for path in paths.values():
+        os.makedirs(path, exist_ok=True)
+    env_kwargs = dict(env_kwargs or {})
+    if run_dir is not None:
+        env_kwargs.setdefault("trajectory_store", TrajectoryStore(os.path.join(paths["logs"], "trajectories")))
+
+    if surrogate is not None:
+        train_env = SurrogateVecEnv(surrogate, n_envs=n_envs, seed=seed)
+    else:
+        train_env = make_vec_env(
+            subconfig,
+            n_envs=n_envs,
+            seed=seed,
+            start_method=start_method,
+            backend=backend,
+            env_kwargs=env_kwargs,
+            log_dir=paths["monitor"],
+        )
+    # a single VecNormalize wraps all workers, so its running statistics are updated from the merged
+    # batch of every worker's observations and returns rather than per worker
+    if pretrained is not None:
+        env = VecNormalize.load(f"{pretrained.rstrip('/')[: -len('_best')]}_normalize.pkl", train_env)
+        env.training = True
+    else:
+        env = VecNormalize(train_env, norm_obs=True, norm_reward=True)  # Normalize observations and rewards
+
+    # the eval env observes the training channels at the training decision rate, so `_best` is picked under
+    # the trained dynamics. The same settings are saved with the model for evaluate.py to rebuild the env
+    eval_env_kwargs = {key: env_kwargs[key] for key in EVAL_ENV_KWARGS if key in env_kwargs}
+    save_env_settings(os.path.join(paths["models"], subconfig), eval_env_kwargs)
+    eval_env_kwargs["trajectory_store"] = env_kwargs.get("trajectory_store")
+    eval_env = DummyVecEnv([lambda: FDM_env(**eval_env_kwargs)])  # Create a vectorized environment for evaluation
     eval_env = VecNormalize(
         eval_env, norm_obs=True, norm_reward=False, training=False
     )  # Normalize observations but not rewards for evaluation
 
-    # Define the callback
+    # stop the run early when its evaluations fall behind the other trials of the sweep
+    pruning_callback = None
+    if prune is not None:
+        reports = TrialReports(pruning_dir or os.path.join(paths["logs"], "pruning"))
+        pruning_callback = PruningCallback(
+            subconfig, reports, make_pruner(prune, total_timesteps, prune_warmup), run_dir or paths["logs"]
+        )
+
+    # Define the callback, EvalCallback syncs the eval normalization statistics from the training env
     eval_callback = EvalCallback(
         eval_env,
-        best_model_save_path=f"./models/{subconfig}_best/",
-        log_path="./logs/",
-        eval_freq=20000,
+        best_model_save_path=os.path.join(paths["models"], f"{subconfig}_best"),
+        log_path=paths["logs"],
+        eval_freq=max(20000 // n_envs, 1),  # eval_freq counts vectorized steps, keep it in env steps
         n_eval_episodes=5,
         deterministic=True,
         render=False,
+        callback_after_eval=pruning_callback,
     )
 
+    callbacks = [eval_callback] + list(callbacks or [])
+    if env_kwargs.get("profile") and surrogate is None:
+        # per phase env timings next to the eval scalars, the surrogate env has no per env phases to time
+        callbacks.append(PhaseTimingCallback())
+
     env.reset()  # Reset the environment to get the initial observation
-    ppo_model = algo("MlpPolicy", env, verbose=1, tensorboard_log="./ppo_jsbsim_tensorboard/", **ppo_kwargs)
+    if pretrained is not None:
+        # the architecture comes from the pretrained model, the config only changes the training settings
+        ppo_kwargs.pop("policy_kwargs", None)
+        ppo_model = algo.load(
+            os.path.join(pretrained, "best_model.zip"), env=env, tensorboard_log=paths["tensorboard"], **ppo_kwargs
+        )
+    else:
+        ppo_model = algo("MlpPolicy", env, verbose=1, tensorboard_log=paths["tensorboard"], **ppo_kwargs)
     ppo_model.learn(
-        total_timesteps=1_000_00, callback=eval_callback, tb_log_name=subconfig
+        total_timesteps=total_timesteps, callback=CallbackList(callbacks), tb_log_name=subconfig
     )  # Adjust the number of timesteps as needed
 
-    env.save(f"models/{subconfig}_normalize.pkl")  # Save the VecNormalize statistics
+    env.save(os.path.join(paths["models"], f"{subconfig}_normalize.pkl"))  # Save the VecNormalize statistics
+    env.close()
     print(f"Training complete. Model saved as '{subconfig}.zip'.")
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Train PPO on the JSBSim flight environment.")
+    parser.add_argument("--n-envs", type=int, default=1, help="number of parallel subprocess workers")
+    parser.add_argument("--seed", type=int, default=0, help="base seed, worker i is seeded with seed + i")
+    parser.add_argument(
+        "--start-method", default=None, help="multiprocessing start method for the workers (fork, forkserver, spawn)"
+    )
+    parser.add_argument(
+        "--vec-env", choices=sorted(VEC_ENV_BACKENDS), default="shm", help="worker transport used when n-envs > 1"
+    )
+    parser.add_argument(
+        "--ic-cache", type=int, default=0, help="cached randomized initial conditions sampled at reset, 0 disables"
+    )
+    parser.add_argument("--ic-bank", default=None, help="saved InitialConditionBank (.npy) consumed at reset")
+    parser.add_argument("--action-repeat", type=int, default=1, help="frames the action is held per decision")
+    parser.add_argument("--physics-substeps", type=int, default=1, help="JSBSim steps per 0.1 s frame")
+    parser.add_argument("--accumulate-reward", action="store_true", help="sum the reward over repeated frames")
+    parser.add_argument("--profile", action="store_true", help="log per phase env timings to TensorBoard")
+    parser.add_argument(
+        "--step-log", choices=STEP_LOG_MODES, default="structured", help="per step logging of recorded episodes"
+    )
+    parser.add_argument(
+        "--observation-channels", nargs="+", default=None, help="observation channels, see environment/observation.py"
+    )
+    parser.add_argument("--step-log-every", type=int, default=1, help="log every n-th step of a recorded episode")
+    parser.add_argument("--config", default="config/ppo_config.yaml", help="ppo config file")
+    parser.add_argument(
+        "--subconfig", action="append", default=None, help="train only this top level config, can be repeated"
+    )
+    parser.add_argument("--run-dir", default=None, help="isolate every output of the run under this directory")
+    parser.add_argument("--total-timesteps", type=int, default=1_000_00)
+    parser.add_argument("--torch-threads", type=int, default=None, help="torch intra-op threads of the learner")
+    parser.add_argument("--prune", choices=sorted(PRUNERS), default=None, help="stop the run early if it falls behind")
+    parser.add_argument("--pruning-dir", default=None, help="evaluation reports shared by the trials of a sweep")
+    parser.add_argument(
+        "--prune-warmup", type=float, default=PRUNE_WARMUP, help="fraction of the steps trained before pruning"
+    )
+    parser.add_argument(
+        "--surrogate", default=None, help="train on n-envs surrogate aircraft (.npz from environment/surrogate.py)"
+    )
+    parser.add_argument("--pretrained", default=None, help="<prefix>_best model directory to continue training from")
+    args = parser.parse_args()
+    if args.surrogate is not None and args.profile:
+        parser.error("--profile times the phases of the JSBSim env workers, there are none with --surrogate")
+    if args.surrogate is not None and args.observation_channels is not None:
+        parser.error("the surrogate aircraft observe the default channels, --observation-channels does not apply")
+
+    if args.torch_threads is not None:
+        torch.set_num_threads(args.torch_threads)
+
     # get the top level configs from the config file
-    with open("config/ppo_config.yaml", "r") as f:
+    with open(args.config, "r") as f:
         config = yaml.load(f, Loader=yaml.FullLoader)
-    top_level_configs = list(config.keys())
+    top_level_configs = args.subconfig or list(config.keys())
 
     for subconfig in top_level_configs:
-        train(algo=PPO, subconfig=subconfig)
+        train(
+            algo=PPO,
+            subconfig=subconfig,
+            n_envs=args.n_envs,
+            seed=args.seed,
+            start_method=args.start_method,
+            backend=args.vec_env,
+            env_kwargs={
+                "ic_cache_size": args.ic_cache,
+                "ic_bank": args.ic_bank,
+                "action_repeat": args.action_repeat,
+                "physics_substeps": args.physics_substeps,
+                "accumulate_reward": args.accumulate_reward,
+                "profile": args.profile,
+                "step_log": args.step_log,
+                "step_log_every": args.step_log_every,
+                "observation_channels": args.observation_channels,
+            },
+            config_path=args.config,
+            run_dir=args.run_dir,
+            total_timesteps=args.total_timesteps,
+            prune=args.prune,
+            pruning_dir=args.pruning_dir,
+            prune_warmup=args.prune_warmup,
+            surrogate=args.surrogate,
+            pretrained=args.pretrained,
+        )
@@ -0,0 +1,59 @@
+from time import perf_counter
+
+from stable_baselines3.common.callbacks import BaseCallback
+
+from utils.profiling import STEP_PHASES
+
+
+class PhaseTimingCallback(BaseCallback):
+    """Emit the per phase env timings of every rollout as TensorBoard scalars.
+
+    Requires the training envs to be created with `FDM_env(profile=True)`. At the end of each
+    rollout the timers of all workers are collected through `env_method`, summed and recorded
+    under `timing/`:
+
+    - `env_steps_per_sec`: env steps of the rollout over its wall clock time
+    - `reset_share`: fraction of the env time spent in `reset`
+    - `physics_share` / `python_overhead_share`: JSBSim propagation vs. everything else in `step`
+    - `<phase>_us`: mean time per step of each phase
+    """
+
+    def __init__(self, verbose=0):
+        super().__init__(verbose)
+        self._rollout_start = 0.0
+        self._rollout_steps = 0
+
+    def _on_rollout_start(self):
+        self._rollout_start = perf_counter()
+        self._rollout_steps = self.num_timesteps
+
+    def _on_step(self):
+        return True
+
+    def _on_rollout_end(self):
+        elapsed = perf_counter() - self._rollout_start
+        env_steps = self.num_timesteps - self._rollout_steps
+
+        totals, counts = {}, {}
+        for timings in self.training_env.env_method("pop_phase_timings"):
+            for phase, total in timings["totals"].items():
+                totals[phase] = totals.get(phase, 0.0) + total
+                counts[phase] = counts.get(phase, 0) + timings["counts"][phase]
+        if not totals:
+            return
+
+        step_time = sum(totals.get(phase, 0.0) for phase in STEP_PHASES)
+        env_time = step_time + totals.get("reset", 0.0)
+        n_steps = max(counts.get("done", 0), 1)
+
+        self.logger.record("timing/env_steps_per_sec", env_steps / elapsed if elapsed > 0 else 0.0)
+        if env_time > 0:
+            self.logger.record("timing/reset_share", totals.get("reset", 0.0) / env_time)
+        if step_time > 0:
+            physics_share = totals.get("physics", 0.0) / step_time
+            self.logger.record("timing/physics_share", physics_share)
+            self.logger.record("timing/python_overhead_share", 1.0 - physics_share)
+        for phase, total in totals.items():
+            # step phases are averaged per step, reset per reset
+            n_calls = max(counts[phase], 1) if phase == "reset" else n_steps
+            self.logger.record(f"timing/{phase}_us", 1e6 * total / n_calls)
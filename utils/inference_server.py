@@ -0,0 +1,118 @@
+import multiprocessing as mp
+import queue
+import threading
+from time import perf_counter
+
+import numpy as np
+
+
+def sb3_policy(model, vecnorm=None, deterministic=True):
+    """Batch policy function of a Stable-Baselines3 model, normalizing with `vecnorm` statistics if given."""
+
+    def policy(observations):
+        if vecnorm is not None:
+            observations = vecnorm.normalize_obs(observations)
+        actions, _ = model.predict(observations, deterministic=deterministic)
+        return actions
+
+    return policy
+
+
+class InferenceClient:
+    """Worker side handle of an `InferenceServer`, created by `InferenceServer.client`.
+
+    Only picklable while a process is being started, pass it as a `Process` argument.
+    """
+
+    def __init__(self, client_id, requests, response):
+        self.client_id = client_id
+        self._requests = requests
+        self._response = response
+
+    def predict(self, observation):
+        """Send one observation and block until the server returns its action."""
+        self._requests.put((self.client_id, observation))
+        return self._response.recv()
+
+    def close(self):
+        """Tell the server this client will not send more requests."""
+        self._requests.put((self.client_id, None))
+
+
+class InferenceServer:
+    """Runs a policy on batches of observations sent by many env worker processes.
+
+    Workers call `InferenceClient.predict` with a single observation. A server thread takes the
+    first pending request and keeps collecting until `max_batch` requests, every active client
+    has one pending, or `max_wait` seconds passed, then runs the policy once on the stacked
+    batch and sends every worker its action. The per call overhead of the policy is paid once
+    per batch instead of once per env, so throughput scales with the number of envs.
+
+    Args:
+        policy (callable): Maps an (n, obs_dim) array to an (n, action_dim) array, see `sb3_policy`.
+        n_clients (int): Number of worker clients.
+        max_batch (int): Largest batch passed to the policy.
+        max_wait (float): Longest time in seconds a request waits for the batch to fill.
+        context: multiprocessing context the workers are started with.
+    """
+
+    def __init__(self, policy, n_clients, max_batch=256, max_wait=0.002, context=None):
+        self.policy = policy
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        ctx = context or mp.get_context()
+        self._requests = ctx.Queue()
+        pipes = [ctx.Pipe(duplex=False) for _ in range(n_clients)]
+        self._responses = [send for _, send in pipes]
+        self._clients = [InferenceClient(i, self._requests, recv) for i, (recv, _) in enumerate(pipes)]
+        self._active = n_clients
+        self._thread = threading.Thread(target=self._serve, daemon=True)
+        self.n_batches = 0
+        self.n_requests = 0
+
+    def client(self, client_id):
+        return self._clients[client_id]
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def join(self):
+        """Wait until every client closed."""
+        self._thread.join()
+
+    @property
+    def mean_batch_size(self):
+        return self.n_requests / self.n_batches if self.n_batches else 0.0
+
+    def _collect(self):
+        """Block for the next batch of (client id, observation) requests, handling client shutdowns."""
+        batch = []
+        deadline = None
+        while len(batch) < min(self.max_batch, self._active):
+            timeout = None if deadline is None else deadline - perf_counter()
+            if timeout is not None and timeout <= 0:
+                break
+            try:
+                client_id, observation = self._requests.get(timeout=timeout)
+            except queue.Empty:
+                break
+            if observation is None:
+                self._active -= 1
+                continue
+            batch.append((client_id, observation))
+            if deadline is None:
+                deadline = perf_counter() + self.max_wait
+        return batch
+
+    def _serve(self):
+        while self._active > 0:
+            batch = self._collect()
+            if not batch:
+                continue
+            client_ids, observations = zip(*batch)
+            actions = self.policy(np.stack(observations))
+            for client_id, action in zip(client_ids, actions):
+                self._responses[client_id].send(action)
+            self.n_batches += 1
+            self.n_requests += len(batch)
@@ -1,8 +1,4 @@
 import jsbsim
-import matplotlib
-matplotlib.use('Qt5Agg')  # Use TkAgg backend for matplotlib
-import matplotlib.pyplot as plt
-import ipdb
 from utils.constants import P
 import flightgear_python
 from flightgear_python.fg_if import FDMConnection
@@ -22,6 +18,10 @@ def fdm_callback(fdm_data, event_pipe):
     return fdm_data
 
 def JSB():
+    import matplotlib
+    matplotlib.use('Qt5Agg')  # Use TkAgg backend for matplotlib
+    import matplotlib.pyplot as plt
+
     fdm = jsbsim.FGFDMExec(None)
     jsbsim.FGJSBBase().debug_lvl=0
     fdm.load_script('scripts/c1723.xml')
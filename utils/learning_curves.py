@@ -0,0 +1,307 @@
+import glob
+import json
+import os
+import re
+import struct
+import sys
+from urllib.parse import quote
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# polars and the TensorBoard protos are imported where they are used
+
+CURVE_DIR = "logs/learning_curves"
+STATE_FILE = "state.json"
+MONITOR_ROOTS = ("training_logs", "sweeps")
+TENSORBOARD_ROOTS = ("ppo_jsbsim_tensorboard", "sweeps")
+MONITOR_PATTERN = re.compile(r"^(?P<run>.*?)_log(?:_(?P<worker>\d+))?\.csv\.monitor\.csv$")
+BOOLEANS = {"True": 1.0, "False": 0.0}
+FINGERPRINT_BYTES = 128  # the Monitor header line with its t_start, the first event of an event file
+
+
+def _monitor_run(root, path):
+    """Run and worker of a Monitor file.
+
+    `training_logs/ppo_log.csv.monitor.csv` is ("ppo", 0) and
+    `sweeps/cfg/run/training_logs/run_log_3.csv.monitor.csv` is ("cfg/run", 3).
+    """
+    match = MONITOR_PATTERN.match(os.path.basename(path))
+    name, worker = (match["run"], int(match["worker"] or 0)) if match else (os.path.basename(path), 0)
+    parent = os.path.relpath(os.path.dirname(path), root)
+    if os.path.basename(parent) == "training_logs":
+        parent = os.path.dirname(parent)
+    return (name if parent in ("", ".") else parent.replace(os.sep, "/")), worker
+
+
+def _tensorboard_run(root, path):
+    """Run of an event file, its directory relative to the TensorBoard root (one per `learn` call in SB3)."""
+    return os.path.relpath(os.path.dirname(path), root).replace(os.sep, "/")
+
+
+def _fingerprint(path, n_bytes=FINGERPRINT_BYTES):
+    with open(path, "rb") as f:
+        return f.read(n_bytes).hex()
+
+
+def _rewritten(path, source, stat):
+    """Whether `path` is no longer the file `source` was ingested from.
+
+    Monitor opens its file with "w", so a restarted run truncates it and writes a new header. Once
+    the new file outgrew the old offset only its first bytes (or the inode, when replaced) tell.
+    """
+    if stat.st_size < source["offset"] or source.get("inode", stat.st_ino) != stat.st_ino:
+        return True
+    fingerprint = source.get("fingerprint", "")
+    return _fingerprint(path, len(fingerprint) // 2) != fingerprint
+
+
+def _read_complete_lines(path, offset):
+    """Bytes of `path` from `offset` up to the last newline, a line still being written is left for later."""
+    with open(path, "rb") as f:
+        f.seek(offset)
+        data = f.read()
+    end = data.rfind(b"\n") + 1
+    return data[:end], offset + end
+
+
+def parse_monitor(path, source):
+    """New rows of a Monitor CSV since `source["offset"]`, updating `source` in place.
+
+    The json header line and the column line are parsed on the first call only. Every column
+    is stored as float64, the "True"/"False" info keywords as 1.0/0.0.
+    """
+    data, offset = _read_complete_lines(path, source["offset"])
+    lines = data.decode().splitlines()
+    if source["offset"] == 0:
+        if len(lines) < 2:
+            return []  # header not written yet
+        source["t_start"] = json.loads(lines[0].lstrip("#")).get("t_start", 0.0)
+        source["columns"] = lines[1].split(",")
+        lines = lines[2:]
+    source["offset"] = offset
+    rows = []
+    for line in lines:
+        if line:
+            rows.append([BOOLEANS[v] if v in BOOLEANS else float(v or "nan") for v in line.split(",")])
+    return rows
+
+
+def parse_events(path, source):
+    """Scalar (step, wall_time, tag, value) rows of a TensorBoard event file since `source["offset"]`.
+
+    The file is a sequence of TFRecords (u64 length, u32 length crc, data, u32 data crc); only
+    complete records are read, so a file still being written is resumed at the next call.
+    """
+    from tensorboard.compat.proto import event_pb2
+
+    with open(path, "rb") as f:
+        f.seek(source["offset"])
+        data = f.read()
+    rows = []
+    position = 0
+    while position + 12 <= len(data):
+        (length,) = struct.unpack_from("<Q", data, position)
+        end = position + 12 + length + 4
+        if end > len(data):
+            break
+        event = event_pb2.Event.FromString(data[position + 12 : end - 4])
+        for value in event.summary.value:
+            if value.HasField("simple_value"):
+                scalar = value.simple_value
+            elif value.HasField("tensor") and (value.tensor.float_val or value.tensor.double_val):
+                scalar = (value.tensor.float_val or value.tensor.double_val)[0]
+            else:
+                continue
+            rows.append((event.step, event.wall_time, value.tag, float(scalar)))
+        position = end
+    source["offset"] += position
+    return rows
+
+
+class LearningCurveIndex:
+    """Incremental index of the learning curves of every training run.
+
+    `update` scans the Monitor CSVs and TensorBoard event files under the given roots and
+    parses only the bytes appended since the last update, tracked per file in
+    `<cache_dir>/state.json`. Every run keeps a zstd compressed Arrow IPC cache,
+    `<cache_dir>/monitor/<run>.arrow` (one row per episode and Monitor worker) and
+    `<cache_dir>/scalars/<run>.arrow` (step, wall_time, tag, value), so queries across all sweep
+    runs read the caches instead of the logs. A file rewritten by a restarted run, detected by
+    its first bytes and inode, replaces the rows cached from it and is ingested from the start.
+
+    Args:
+        cache_dir (str): Directory of the caches and the offsets.
+        monitor_roots (tuple): Directories searched recursively for `*.monitor.csv`.
+        tensorboard_roots (tuple): Directories searched recursively for `events.out.tfevents.*`.
+    """
+
+    def __init__(self, cache_dir=CURVE_DIR, monitor_roots=MONITOR_ROOTS, tensorboard_roots=TENSORBOARD_ROOTS):
+        self.cache_dir = cache_dir
+        self.monitor_roots = monitor_roots
+        self.tensorboard_roots = tensorboard_roots
+        path = os.path.join(cache_dir, STATE_FILE)
+        self.sources = {}
+        if os.path.exists(path):
+            with open(path, "r") as f:
+                self.sources = json.load(f)
+
+    def cache_path(self, kind, run):
+        return os.path.join(self.cache_dir, kind, quote(run, safe="") + ".arrow")
+
+    def _discover(self):
+        for root in self.monitor_roots:
+            for path in glob.glob(os.path.join(glob.escape(root), "**", "*.monitor.csv"), recursive=True):
+                run, worker = _monitor_run(root, path)
+                yield path, {"kind": "monitor", "run": run, "worker": worker}
+        for root in self.tensorboard_roots:
+            for path in glob.glob(os.path.join(glob.escape(root), "**", "events.out.tfevents.*"), recursive=True):
+                yield path, {"kind": "scalars", "run": _tensorboard_run(root, path)}
+
+    def update(self):
+        """Ingest the data appended to every log since the last update, returns the number of new rows per run."""
+        import polars as pl
+
+        new_rows = {}  # (kind, run) -> list of new frames
+        reset = {}  # (kind, run) -> sources whose cached rows are dropped
+        for path, found in self._discover():
+            source = self.sources.get(path)
+            stat = os.stat(path)
+            if source is not None and _rewritten(path, source, stat):
+                reset.setdefault((source["kind"], source["run"]), set()).add(path)
+                source = None
+            if source is None:
+                source = self.sources[path] = {**found, "offset": 0, "inode": stat.st_ino}
+            source.setdefault("inode", stat.st_ino)  # sources recorded before inodes were
+            if len(source.get("fingerprint", "")) < 2 * FINGERPRINT_BYTES:
+                source["fingerprint"] = _fingerprint(path)  # files shorter than the fingerprint at the last update
+            if stat.st_size == source["offset"]:
+                continue
+            if source["kind"] == "monitor":
+                rows = parse_monitor(path, source)
+                if not rows:
+                    continue
+                frame = pl.DataFrame(rows, schema=source["columns"], orient="row").with_columns(
+                    pl.col("t") + source["t_start"],
+                    pl.lit(source["worker"], dtype=pl.Int32).alias("worker"),
+                    pl.lit(path).alias("source"),
+                )
+            else:
+                rows = parse_events(path, source)
+                if not rows:
+                    continue
+                frame = pl.DataFrame(
+                    rows,
+                    schema={"step": pl.Int64, "wall_time": pl.Float64, "tag": pl.Utf8, "value": pl.Float64},
+                    orient="row",
+                ).with_columns(pl.lit(path).alias("source"))
+            new_rows.setdefault((source["kind"], source["run"]), []).append(frame)
+
+        for kind, run in new_rows.keys() | reset.keys():
+            path = self.cache_path(kind, run)
+            frames = []
+            if os.path.exists(path):
+                cached = pl.read_ipc(path, memory_map=False)
+                frames.append(cached.filter(~pl.col("source").is_in(list(reset.get((kind, run), ())))))
+            frames.extend(new_rows.get((kind, run), []))
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            pl.concat(frames, how="diagonal_relaxed").write_ipc(path + ".tmp", compression="zstd")
+            os.replace(path + ".tmp", path)
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        with open(os.path.join(self.cache_dir, STATE_FILE) + ".tmp", "w") as f:
+            json.dump(self.sources, f)
+        os.replace(os.path.join(self.cache_dir, STATE_FILE) + ".tmp", os.path.join(self.cache_dir, STATE_FILE))
+        return {run: sum(len(frame) for frame in frames) for (_, run), frames in new_rows.items()}
+
+    def runs(self, kind="monitor"):
+        """Names of the indexed runs with a `kind` ("monitor" or "scalars") cache."""
+        return sorted({source["run"] for source in self.sources.values() if source["kind"] == kind})
+
+    def _scan(self, kind, runs):
+        import polars as pl
+
+        frames = [
+            pl.scan_ipc(self.cache_path(kind, run)).with_columns(pl.lit(run).alias("run"))
+            for run in (self.runs(kind) if runs is None else runs)
+            if os.path.exists(self.cache_path(kind, run))
+        ]
+        return pl.concat(frames, how="diagonal_relaxed") if frames else pl.LazyFrame()
+
+    def monitor(self, runs=None, window=100):
+        """Episodes of `runs` (all when None) in completion order with their env `timesteps` and smoothed return.
+
+        `timesteps` sums the episode lengths of all Monitor workers of a run up to the episode,
+        `smoothed` is the rolling mean of `r` over `window` episodes of the run.
+        """
+        import polars as pl
+
+        frame = self._scan("monitor", runs)
+        if not frame.collect_schema().names():
+            return pl.DataFrame()
+        return (
+            frame.sort("run", "t")
+            .with_columns(
+                pl.col("l").cum_sum().over("run").alias("timesteps"),
+                pl.col("r").rolling_mean(window, min_samples=1).over("run").alias("smoothed"),
+            )
+            .collect()
+        )
+
+    def scalars(self, tag="rollout/ep_rew_mean", runs=None):
+        """TensorBoard scalar `tag` of `runs` (all when None) as run, step, wall_time and value columns."""
+        import polars as pl
+
+        frame = self._scan("scalars", runs)
+        if not frame.collect_schema().names():
+            return pl.DataFrame()
+        frame = frame.filter(pl.col("tag") == tag).select("run", "step", "wall_time", "value")
+        return frame.sort("run", "step").collect()
+
+    def plot(self, path="plots/learning_curves.png", tag=None, runs=None, window=100):
+        """Plot the smoothed Monitor returns against env steps, or the TensorBoard scalar `tag`, one line per run."""
+        import matplotlib.pyplot as plt
+
+        from utils.plotting import downsample
+
+        if tag is None:
+            curves, x, y = self.monitor(runs, window), "timesteps", "smoothed"
+            ylabel = f"return ({window} episode mean)"
+        else:
+            curves, x, y, ylabel = self.scalars(tag, runs), "step", "value", tag
+        figure, ax = plt.subplots(figsize=(12, 6))
+        if len(curves):
+            for (run,), curve in curves.partition_by("run", as_dict=True, maintain_order=True).items():
+                ax.plot(*downsample(curve[x], curve[y]), label=run, linewidth=1)
+        ax.set_xlabel("env steps")
+        ax.set_ylabel(ylabel)
+        ax.set_title("learning progress")
+        ax.grid(True, alpha=0.3)
+        if len(curves):
+            ax.legend(fontsize="small")
+        figure.tight_layout()
+        figure.savefig(path)
+        plt.close(figure)
+
+
+if __name__ == "__main__":
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(description="Index the learning curves of all runs and plot them.")
+    parser.add_argument("--cache-dir", default=CURVE_DIR)
+    parser.add_argument("--monitor-root", nargs="*", default=list(MONITOR_ROOTS), help="searched for Monitor CSVs")
+    parser.add_argument(
+        "--tensorboard-root", nargs="*", default=list(TENSORBOARD_ROOTS), help="searched for TensorBoard event files"
+    )
+    parser.add_argument("--tag", default=None, help="plot this TensorBoard scalar instead of the Monitor returns")
+    parser.add_argument("--runs", nargs="*", default=None, help="runs to plot, all by default")
+    parser.add_argument("--window", type=int, default=100, help="episodes of the rolling mean")
+    parser.add_argument("--out", default="plots/learning_curves.png")
+    args = parser.parse_args()
+
+    index = LearningCurveIndex(args.cache_dir, tuple(args.monitor_root), tuple(args.tensorboard_root))
+    start = time.perf_counter()
+    new_rows = index.update()
+    print(f"Ingested {sum(new_rows.values())} new rows of {len(new_rows)} runs in {time.perf_counter() - start:.2f} s")
+    index.plot(args.out, tag=args.tag, runs=args.runs, window=args.window)
+    print(f"Saved {args.out}")
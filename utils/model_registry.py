@@ -0,0 +1,316 @@
+import glob
+import hashlib
+import json
+import os
+import pickle
+import re
+import zipfile
+from functools import lru_cache
+
+# stable_baselines3 (and with it torch) is imported by `load_model` only, indexing and
+# querying the manifest never load a model
+
+MODEL_DIR = "models"
+MANIFEST_FILE = "registry.json"
+ENV_SETTINGS_SUFFIX = "_env.json"  # `FDM_env` settings a model is trained with, next to its _normalize.pkl
+# SB3 model attributes recorded as the hyperparameters of a model
+HYPERPARAMETER_KEYS = (
+    "learning_rate",
+    "gamma",
+    "gae_lambda",
+    "batch_size",
+    "n_steps",
+    "n_epochs",
+    "ent_coef",
+    "vf_coef",
+    "clip_range",
+    "max_grad_norm",
+    "n_envs",
+)
+# abbreviations used in the config (and so directory) names
+TAG_ALIASES = {"a": "learning_rate", "ent": "ent_coef"}
+TAG_PATTERN = re.compile(r"([A-Za-z_]\w*)=([^,]+)")
+
+
+def parse_tags(name):
+    """Hyperparameters spelled in a model path.
+
+    `ent=0.02/a=0.0003, gamma=0.99_1` is {"ent_coef": 0.02, "learning_rate": 0.0003, "gamma": 0.99}.
+    """
+    tags = {}
+    for part in name.split("/"):
+        for key, value in TAG_PATTERN.findall(part):
+            value = re.sub(r"_\d+$", "", value.strip())  # trailing run counter
+            try:
+                value = float(value) if any(c in value for c in ".e") else int(value)
+            except ValueError:
+                pass
+            tags[TAG_ALIASES.get(key, key)] = value
+    return tags
+
+
+def file_sha256(path, chunk_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def read_model_data(model_path):
+    """The json `data` member of an SB3 zip: attributes and training progress, without loading torch."""
+    with zipfile.ZipFile(model_path) as archive:
+        return json.loads(archive.read("data"))
+
+
+def save_env_settings(prefix, settings):
+    """Write the `FDM_env` kwargs the model `<prefix>_best` is trained with to `<prefix>_env.json`."""
+    with open(prefix + ENV_SETTINGS_SUFFIX, "w") as f:
+        json.dump(settings, f, indent=2)
+
+
+def load_env_settings(prefix):
+    """Saved `FDM_env` settings of the model `<prefix>_best`, {} (the defaults) for models saved without them."""
+    path = prefix + ENV_SETTINGS_SUFFIX
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def env_kwargs(settings):
+    """`FDM_env` kwargs of saved settings, json turned the (name, property, scale) channels into lists."""
+    kwargs = dict(settings)
+    if kwargs.get("observation_channels") is not None:
+        kwargs["observation_channels"] = [
+            tuple(channel) if isinstance(channel, list) else channel for channel in kwargs["observation_channels"]
+        ]
+    return kwargs
+
+
+def evaluation_condition(seeds, randomization_factors):
+    """Key of the `evaluate.py` settings a return is recorded under, returns are only compared under equal keys."""
+    return "seeds={}|randomization_factors={}".format(
+        ",".join(str(seed) for seed in sorted(set(seeds))),
+        ",".join(str(float(factor)) for factor in sorted(set(randomization_factors))),
+    )
+
+
+def rank_value(entry, key="score", condition=None):
+    """Value of `key` a model is ranked by, None if it has none.
+
+    "score" is the mean return recorded under the evaluation `condition`, or the `EvalCallback`
+    best reward of models not evaluated under it. "evaluated_return" is only the former.
+    """
+    evaluated_return = entry.get("evaluated_returns", {}).get(condition)
+    if key == "evaluated_return":
+        return evaluated_return
+    if key == "score":
+        return evaluated_return if evaluated_return is not None else entry.get("eval_reward")
+    return entry.get(key)
+
+
+def best_eval_reward(models_dir):
+    """Best mean reward of the `EvalCallback` log of a `train.py --run-dir` run, None if there is none.
+
+    The shared `logs/` of runs without a run directory belong to whichever run trained last,
+    they are not attributed to a model.
+    """
+    run_dir = os.path.dirname(os.path.abspath(models_dir))
+    path = os.path.join(run_dir, "logs", "evaluations.npz")
+    if run_dir == os.getcwd() or not os.path.exists(path):
+        return None
+    import numpy as np
+
+    with np.load(path) as evaluations:
+        results = evaluations["results"]
+    return float(results.mean(axis=1).max()) if len(results) else None
+
+
+@lru_cache(maxsize=8)
+def load_model(model_path, normalize_path=None, device="cpu"):
+    """Load a model and its `VecNormalize` statistics once per process.
+
+    The statistics are unpickled without an env, they are only used to normalize observations.
+    """
+    from stable_baselines3 import PPO
+
+    model = PPO.load(model_path, device=device)
+    vecnorm = None
+    if normalize_path is not None:
+        with open(normalize_path, "rb") as f:
+            vecnorm = pickle.load(f)
+        vecnorm.training = False
+        vecnorm.norm_reward = False
+    return model, vecnorm
+
+
+class ModelRegistry:
+    """Manifest of every saved model under `root`, with its metadata, for querying without opening the models.
+
+    A model is a `<prefix>_best/best_model.zip` with optional `<prefix>_normalize.pkl` and
+    `<prefix>_env.json` siblings. `update` records per model its hyperparameters (read from the
+    zip and spelled in the path), the env settings it was trained with (observation channels,
+    action repeat, ...), training steps, evaluation score and the sha256 of both files in
+    `<root>/registry.json`. Files whose size and modification time did not change since the
+    last update are not read again, so an update after a new run only opens the new models.
+
+    The mean returns of `evaluate.py` runs are recorded with `record_returns` per evaluation
+    condition (the seeds and randomization factors), a run with other settings does not replace
+    them. The score of a model under a condition is its return under it, otherwise the best mean
+    reward of the `EvalCallback` that saved it (`rank_value`).
+
+    Args:
+        root (str): Directory searched recursively for `*_best` model directories.
+    """
+
+    def __init__(self, root=MODEL_DIR):
+        self.root = root
+        self.path = os.path.join(root, MANIFEST_FILE)
+        self.models = {}
+        if os.path.exists(self.path):
+            with open(self.path, "r") as f:
+                self.models = json.load(f)
+
+    def _save(self):
+        with open(self.path + ".tmp", "w") as f:
+            json.dump(self.models, f, indent=2, sort_keys=True)
+        os.replace(self.path + ".tmp", self.path)
+
+    def _index(self, name, model_path, normalize_path, entry):
+        """Entry of one model, reusing the fields of `entry` whose file did not change."""
+        stat = os.stat(model_path)
+        model_stamp = [stat.st_size, stat.st_mtime_ns]
+        if entry.get("model_stamp") != model_stamp:
+            data = read_model_data(model_path)
+            entry = {
+                "hyperparameters": {
+                    key: data[key] for key in HYPERPARAMETER_KEYS if isinstance(data.get(key), (int, float))
+                },
+                "num_timesteps": data.get("num_timesteps"),
+                "model_sha256": file_sha256(model_path),
+                "model_stamp": model_stamp,
+                "evaluated_returns": {},
+                "eval_reward": best_eval_reward(os.path.dirname(os.path.dirname(model_path))),
+            }
+        # returns of manifests written before they were keyed by the evaluation condition
+        entry.pop("score", None)
+        entry.pop("evaluated_return", None)
+        entry.setdefault("evaluated_returns", {})
+        prefix = os.path.dirname(model_path)[: -len("_best")]
+        entry.update(name=name, model_path=model_path, tags=parse_tags(name), env=load_env_settings(prefix))
+        if normalize_path is None:
+            entry.update(normalize_path=None, normalize_sha256=None, normalize_stamp=None)
+        else:
+            stat = os.stat(normalize_path)
+            normalize_stamp = [stat.st_size, stat.st_mtime_ns]
+            if entry.get("normalize_stamp") != normalize_stamp:
+                entry.update(normalize_sha256=file_sha256(normalize_path), normalize_stamp=normalize_stamp)
+            entry["normalize_path"] = normalize_path
+        return entry
+
+    def update(self):
+        """Index new and changed models, forget deleted ones and save the manifest. Returns the changed names."""
+        models = {}
+        changed = []
+        pattern = os.path.join(glob.escape(self.root), "**", "*_best", "best_model.zip")
+        for model_path in sorted(glob.glob(pattern, recursive=True)):
+            prefix = os.path.dirname(model_path)[: -len("_best")]
+            name = os.path.relpath(prefix, self.root).replace(os.sep, "/")
+            normalize_path = f"{prefix}_normalize.pkl"
+            if not os.path.exists(normalize_path):
+                normalize_path = None
+            previous = self.models.get(name, {})
+            entry = self._index(name, model_path, normalize_path, dict(previous))
+            if entry != previous:
+                changed.append(name)
+            models[name] = entry
+        self.models = models
+        os.makedirs(self.root, exist_ok=True)
+        self._save()
+        return changed
+
+    def record_returns(self, returns, condition):
+        """Store the mean evaluation return of models under `condition` (`evaluation_condition`).
+
+        `returns` maps a model name to its value.
+        """
+        for name, value in returns.items():
+            if name in self.models:
+                self.models[name]["evaluated_returns"][condition] = float(value)
+        self._save()
+
+    def query(self, require_normalize=True, **tags):
+        """Entries whose tags or hyperparameters equal `tags`, e.g. `query(gamma=0.99)`."""
+        entries = []
+        for entry in self.models.values():
+            if require_normalize and entry["normalize_path"] is None:
+                continue
+            values = {**entry["tags"], **entry["hyperparameters"]}
+            if all(values.get(key) == value for key, value in tags.items()):
+                entries.append(entry)
+        return entries
+
+    def best(self, n=5, key="score", condition=None, **tags):
+        """The `n` entries with the highest `key` ("score", "eval_reward", "evaluated_return", "num_timesteps").
+
+        Scores and evaluated returns are those under the evaluation `condition`.
+        """
+        entries = [entry for entry in self.query(**tags) if rank_value(entry, key, condition) is not None]
+        return sorted(entries, key=lambda entry: rank_value(entry, key, condition), reverse=True)[:n]
+
+    def frame(self, condition=None):
+        """The manifest as a polars DataFrame, one row per model with the hyperparameters as columns.
+
+        The score and evaluated return are those under the evaluation `condition`.
+        """
+        import polars as pl
+
+        rows = [
+            {
+                "name": entry["name"],
+                "score": rank_value(entry, "score", condition),
+                "evaluated_return": rank_value(entry, "evaluated_return", condition),
+                "eval_reward": entry["eval_reward"],
+                "evaluations": len(entry["evaluated_returns"]),
+                "num_timesteps": entry["num_timesteps"],
+                **entry["hyperparameters"],
+                "model_sha256": entry["model_sha256"][:12],
+            }
+            for entry in self.models.values()
+        ]
+        return pl.DataFrame(rows)
+
+    def load(self, name):
+        """(model, VecNormalize statistics) of a registered model, cached in memory."""
+        entry = self.models[name]
+        return load_model(entry["model_path"], entry["normalize_path"])
+
+
+if __name__ == "__main__":
+    import argparse
+
+    import polars as pl
+
+    parser = argparse.ArgumentParser(description="Index the saved models and list the best ones.")
+    parser.add_argument("--root", default=MODEL_DIR)
+    parser.add_argument("--best", type=int, default=None, help="only list the N best models")
+    parser.add_argument("--key", default="score", help="manifest field the models are ranked by")
+    parser.add_argument(
+        "--seeds", type=int, nargs="+", default=None, help="score by the returns of evaluate.py runs with these seeds"
+    )
+    parser.add_argument("--randomization-factors", type=float, nargs="+", default=[0.0])
+    args = parser.parse_args()
+
+    registry = ModelRegistry(args.root)
+    changed = registry.update()
+    print(f"{len(registry.models)} models in {registry.path}, {len(changed)} new or changed")
+    condition = evaluation_condition(args.seeds, args.randomization_factors) if args.seeds else None
+    names = list(registry.models)
+    if args.best:
+        names = [entry["name"] for entry in registry.best(args.best, args.key, condition)]
+        if not names:
+            print(f"No model has a {args.key}" + (f" under {condition}" if condition else ""))
+    frame = registry.frame(condition).filter(pl.col("name").is_in(names))
+    with pl.Config(tbl_rows=-1, tbl_cols=-1, tbl_width_chars=200):
+        print(frame.sort(args.key, descending=True, nulls_last=True))
@@ -1,25 +1,71 @@
+import multiprocessing as mp
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
 import matplotlib.pyplot as plt
 import numpy as np
 import polars as pl
 import ipdb
 
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.trajectory import derive_states
+
 plt.rcParams['lines.linewidth'] = 2
 
-def plot_trajectory(states, actions, rewards):
-    """Plot the state trajectory using polars DataFrame."""
+MAX_POINTS = 2000  # points per drawn line, a few per horizontal pixel of a subplot
+
+
+def minmax_indices(values, max_points):
+    """Indices of the minimum and maximum of `values` in each of `max_points // 2` equal buckets.
+
+    Keeping both extremes of every bucket preserves the visible shape of the line, spikes
+    included, while drawing at most `max_points + 2` points whatever the episode length.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    n = len(values)
+    if max_points is None or n <= max_points:
+        return np.arange(n)
+    n_buckets = max(max_points // 2, 1)
+    size = -(-n // n_buckets)
+    buckets = np.pad(values, (0, n_buckets * size - n), mode="edge").reshape(n_buckets, size)
+    starts = np.arange(n_buckets) * size
+    indices = np.concatenate([starts + buckets.argmin(axis=1), starts + buckets.argmax(axis=1), [0, n - 1]])
+    return np.unique(np.minimum(indices, n - 1))
+
+
+def downsample(x, y, max_points=MAX_POINTS):
+    """Min-max downsampled (x, y) of a line, see `minmax_indices`."""
+    x, y = np.asarray(x), np.asarray(y)
+    indices = minmax_indices(y, max_points)
+    return x[indices], y[indices]
+
+
+def plot_trajectory(
+    states, actions, rewards, path="plots/flight_dynamics_trajectory_sample.png", max_points=MAX_POINTS
+):
+    """Plot the state trajectory using polars DataFrame.
+
+    Every line is min-max downsampled to `max_points` points (None draws every sample).
+    """
     # Convert polars DataFrame to pandas for plotting
     figure, axes = plt.subplots(3, 3, figsize=(15, 10))
+    states = derive_states(states)
     states = states.with_columns(time = states["time"] - states["time"][0])  # Normalize time to start from 0
+
+    def series(values):
+        return downsample(states["time"], values, max_points)
     
     axright00 = axes[0, 0].twinx()
     axright00.set_ylabel("xy position (ft)")
     axright00.legend(loc="lower right")
-    axright00.plot(states["time"], states["x"], label="x position (ft)")
-    axright00.plot(states["time"], states["y"], label="y position (ft)")
+    axright00.plot(*series(states["x"]), label="x position (ft)")
+    axright00.plot(*series(states["y"]), label="y position (ft)")
     axright00.legend(loc="lower right")
 
     # axes[0,0].plot(states['time'], states['z'], label='z position (ft)')
-    axes[0, 0].plot(states["time"], states["altitude"], label="altitude (ft)", linewidth=4, color="black")
+    axes[0, 0].plot(*series(states["altitude"]), label="altitude (ft)", linewidth=4, color="black")
     # axes[0, 0].set_xlabel("time (s)")
     axes[0,0].set_xticklabels([])  # Hide x-tick labels
 
@@ -27,9 +73,9 @@ def plot_trajectory(states, actions, rewards):
     axes[0, 0].set_title("position")
     axes[0, 0].legend()
 
-    axes[0, 1].plot(states["time"], states["u"], label="u velocity (fps)")
-    axes[0, 1].plot(states["time"], states["v"], label="v velocity (fps)")
-    axes[0, 1].plot(states["time"], -states["w"], label="w velocity (fps)")
+    axes[0, 1].plot(*series(states["u"]), label="u velocity (fps)")
+    axes[0, 1].plot(*series(states["v"]), label="v velocity (fps)")
+    axes[0, 1].plot(*series(-states["w"]), label="w velocity (fps)")
     # axes[0, 1].set_xlabel("time (s)")
     axes[0,1].set_xticklabels([])  # Hide x-tick labels
 
@@ -37,8 +83,8 @@ def plot_trajectory(states, actions, rewards):
     axes[0, 1].set_title("aircraft velocities")
     axes[0, 1].legend()
 
-    axes[1, 0].plot(states["time"], states["phi"], label="phi (deg)")
-    axes[1, 0].plot(states["time"], states["theta"], label="theta (deg)")
+    axes[1, 0].plot(*series(states["phi"]), label="phi (deg)")
+    axes[1, 0].plot(*series(states["theta"]), label="theta (deg)")
 
     # axes[1, 0].set_xlabel("time (s)")
     axes[1,0].set_xticklabels([])  # Hide x-tick labels
@@ -47,9 +93,9 @@ def plot_trajectory(states, actions, rewards):
     axes[1, 0].set_title("attitude")
     axes[1, 0].legend(loc="lower right")
 
-    axes[1, 1].plot(states["time"], states["p"], label="p (deg/s)")
-    axes[1, 1].plot(states["time"], states["q"], label="q (deg/s)")
-    axes[1, 1].plot(states["time"], states["r"], label="r (deg/s)")
+    axes[1, 1].plot(*series(states["p"]), label="p (deg/s)")
+    axes[1, 1].plot(*series(states["q"]), label="q (deg/s)")
+    axes[1, 1].plot(*series(states["r"]), label="r (deg/s)")
     # axes[1, 1].set_xlabel("time (s)")
     axes[1,1].set_xticklabels([])  # Hide x-tick labels
 
@@ -57,15 +103,15 @@ def plot_trajectory(states, actions, rewards):
     axes[1, 1].set_title("angular rates")
     axes[1, 1].legend()
 
-    axes[2, 0].plot(states["time"], states["alpha"], label="alpha (deg)")
-    axes[2, 0].plot(states["time"], states["beta"], label="beta (deg)")
+    axes[2, 0].plot(*series(states["alpha"]), label="alpha (deg)")
+    axes[2, 0].plot(*series(states["beta"]), label="beta (deg)")
     axes[2, 0].set_xlabel("time (s)")
     axes[2, 0].set_ylabel("angle (deg)")
     axes[2, 0].set_title("aerodynamic angles")
     axes[2, 0].legend(loc="lower right")
 
     axright21 = axes[2, 1].twinx()
-    axright21.plot(states["time"], states["psi"], label="psi (deg)", color="blue")
+    axright21.plot(*series(states["psi"]), label="psi (deg)", color="blue")
     axright21.set_ylabel("heading angle (deg)")
     axright21.legend(loc="upper right")
     axright21.yaxis.label.set_color("blue")
@@ -73,18 +119,18 @@ def plot_trajectory(states, actions, rewards):
     axright21.axhline(y=360, color="gray", linewidth=2)
     axright21.set_yticks(np.arange(0, 360, 60))
     axright21.set_ylim(0, 360)
-    axes[2, 1].plot(states["time"], states["gamma"], label="gamma (deg)", color="green")
+    axes[2, 1].plot(*series(states["gamma"]), label="gamma (deg)", color="green")
     axes[2, 1].set_xlabel("time (s)")
     axes[2, 1].set_ylabel("heading angle (deg)")
     axes[2, 1].set_title("navigation angles")
     axes[2, 1].yaxis.label.set_color("green")
     axes[2, 1].legend(loc="lower right")
 
-    axes[2, 2].plot(states["time"], actions["aileron"], label="aileron input")
-    axes[2, 2].plot(states["time"], actions["elevator"], label="elevator input")
-    axes[2, 2].plot(states["time"], actions["rudder"], label="rudder input")
+    axes[2, 2].plot(*series(actions["aileron"]), label="aileron input")
+    axes[2, 2].plot(*series(actions["elevator"]), label="elevator input")
+    axes[2, 2].plot(*series(actions["rudder"]), label="rudder input")
     if "throttle" in actions:
-        axes[2, 2].plot(states["time"], actions["throttle"], label="throttle input")
+        axes[2, 2].plot(*series(actions["throttle"]), label="throttle input")
 
     axes[2, 2].set_xlabel("time (s)")
     axes[2, 2].set_ylabel("normalized control inputs")
@@ -102,10 +148,10 @@ def plot_trajectory(states, actions, rewards):
         axes[1, 2].axis("off")
         axes[0, 2].axis("off")  # Hide the empty subplot
     else:            
-        axes[1, 2].plot(states["time"], rewards["total"], label="total reward", color="black", linewidth=2)
-        axes[1, 2].plot(states["time"], rewards["preservation_bonus"], label="preservation bonus", color="green")
-        axes[1, 2].plot(states["time"], rewards["smoothness_penalty"], label="smoothness bonus", color="red")
-        axes[1, 2].plot(states["time"], rewards["control_penalty"], label="control penalty", color="orange")
+        axes[1, 2].plot(*series(rewards["total"]), label="total reward", color="black", linewidth=2)
+        axes[1, 2].plot(*series(rewards["preservation_bonus"]), label="preservation bonus", color="green")
+        axes[1, 2].plot(*series(rewards["smoothness_penalty"]), label="smoothness bonus", color="red")
+        axes[1, 2].plot(*series(rewards["control_penalty"]), label="control penalty", color="orange")
         # axes[1, 2].set_xlabel("time (s)")
         axes[1,2].set_xticklabels([])  # Hide x-tick labels
         axes[1, 2].set_ylabel("reward components")
@@ -114,24 +160,29 @@ def plot_trajectory(states, actions, rewards):
         axes[1,2].set_ylim(-20, 100)
 
         # get rewards
-        axes[0, 2].plot(states["time"], rewards["total"].cum_sum(), label="total reward", color="black", linewidth=2)
-        axes[0, 2].plot(states["time"], rewards["preservation_bonus"].cum_sum(), label="preservation bonus", color="green")
-        axes[0, 2].plot(states["time"], rewards["smoothness_penalty"].cum_sum(), label="smoothness bonus", color="red")
-        axes[0, 2].plot(states["time"], rewards["control_penalty"].cum_sum(), label="control penalty", color="orange")
+        axes[0, 2].plot(*series(rewards["total"].cum_sum()), label="total reward", color="black", linewidth=2)
+        axes[0, 2].plot(*series(rewards["preservation_bonus"].cum_sum()), label="preservation bonus", color="green")
+        axes[0, 2].plot(*series(rewards["smoothness_penalty"].cum_sum()), label="smoothness bonus", color="red")
+        axes[0, 2].plot(*series(rewards["control_penalty"].cum_sum()), label="control penalty", color="orange")
         # axes[0, 2].set_xlabel("time (s)")
         axes[0,2].set_xticklabels([])  # Hide x-tick labels
         axes[0, 2].set_ylabel("return")
         axes[0, 2].set_title("accumulated rewards")
         axes[0, 2].legend()
-        # axes[0,2].plot(states["time"], rewards["total"].rolling_mean(100), label="smoothed total reward", color="blue")
+        # axes[0,2].plot(*series(rewards["total"].rolling_mean(100)), label="smoothed total reward", color="blue")
 
 
     figure.tight_layout()
-    figure.savefig("plots/flight_dynamics_trajectory_sample.png")
+    figure.savefig(path)
+    plt.close(figure)
 
 
-def plot_path(states, interactive=False):
+def plot_path(states, interactive=False, path="plots/flight_path_sample.png", max_points=MAX_POINTS):
     # plot the path of the aircraft in 3D space
+    states = derive_states(states)
+    # one index set for the three coordinates, keeping the extremes of each
+    indices = np.unique(np.concatenate([minmax_indices(states[key], max_points) for key in ("x", "y", "altitude")]))
+    states = states[indices]
     fig = plt.figure(figsize=(15, 10))
     ax = fig.add_subplot(111, projection="3d")
 
@@ -168,7 +219,53 @@ def plot_path(states, interactive=False):
     if interactive:
         plt.show()
     else:
-        fig.savefig("plots/flight_path_sample.png")
+        fig.savefig(path)
+        plt.close(fig)
+
+
+def _render_episode(root, episode_id, out_dir, max_points):
+    from utils.trajectory_store import TrajectoryStore
+
+    store = TrajectoryStore(root)
+    states = store.read_episode(episode_id, "state")
+    trajectory_path = os.path.join(out_dir, f"{episode_id}_trajectory.png")
+    plot_trajectory(
+        states,
+        store.read_episode(episode_id, "action"),
+        store.read_episode(episode_id, "reward"),
+        path=trajectory_path,
+        max_points=max_points,
+    )
+    path_path = os.path.join(out_dir, f"{episode_id}_path.png")
+    plot_path(states, path=path_path, max_points=max_points)
+    return trajectory_path, path_path
+
+
+def render_episodes(store, episode_ids, out_dir="plots", workers=None, max_points=MAX_POINTS):
+    """Plot the trajectory and path of recorded episodes in parallel processes.
+
+    Every episode gets its own `<out_dir>/<episode_id>_{trajectory,path}.png`, so renders of
+    different episodes, runs or workers never overwrite each other.
+
+    Args:
+        store (TrajectoryStore): Store the episodes were recorded to.
+        episode_ids (list): Episodes to plot.
+        out_dir (str): Output directory.
+        workers (int, optional): Rendering processes, defaults to the number of cores.
+        max_points (int): Points per drawn line.
+
+    Returns:
+        list: (trajectory png, path png) of every episode, in `episode_ids` order.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    os.environ.setdefault("MPLBACKEND", "Agg")  # workers render off screen
+    start_method = "forkserver" if "forkserver" in mp.get_all_start_methods() else "spawn"
+    with ProcessPoolExecutor(workers, mp_context=mp.get_context(start_method)) as pool:
+        futures = [
+            pool.submit(_render_episode, store.root, episode_id, out_dir, max_points) for episode_id in episode_ids
+        ]
+        return [future.result() for future in futures]
+
 
 def plot_smoothed_rewards(rewards, window_size=100):
     """Plot smoothed rewards over time."""
@@ -184,25 +281,40 @@ def plot_smoothed_rewards(rewards, window_size=100):
     plt.savefig("plots/smoothed_rewards.png")
 
 if __name__ == "__main__":
-    # load data from logs using pickle
-    import pickle
-    with open("logs/state_action_reward_history_episode_1000.pkl", "rb") as f:
-        data = pickle.load(f)
-    states = data["state"]
-    actions = data["action"]
-    rewards = data["reward"]
-    plot_trajectory(states, actions, rewards)
-    plot_path(states, interactive=False)
+    import argparse
+    import time
+
+    from utils.trajectory_store import TRAJECTORY_DIR, TrajectoryStore
+
+    parser = argparse.ArgumentParser(description="Plot recorded episodes and the learning progress.")
+    parser.add_argument("--trajectories", default=TRAJECTORY_DIR, help="TrajectoryStore root")
+    parser.add_argument("--episodes", type=int, default=0, help="plot the last N episodes in parallel, 0 the last only")
+    parser.add_argument("--workers", type=int, default=None, help="rendering processes, default one per core")
+    parser.add_argument("--max-points", type=int, default=MAX_POINTS, help="points per line, 0 draws every sample")
+    parser.add_argument("--out-dir", default="plots")
+    args = parser.parse_args()
+    max_points = args.max_points or None
+
+    store = TrajectoryStore(args.trajectories)
+    if args.episodes:
+        # every episode to its own files
+        start = time.perf_counter()
+        episode_ids = store.index()["episode_id"].to_list()[-args.episodes:]
+        render_episodes(store, episode_ids, args.out_dir, workers=args.workers, max_points=max_points)
+        print(f"Plotted {len(episode_ids)} episodes to {args.out_dir} in {time.perf_counter() - start:.1f} s")
+    else:
+        # the last recorded episode to the sample plots
+        episode_id = store.index()["episode_id"][-1]
+        states = store.read_episode(episode_id, "state")
+        actions = store.read_episode(episode_id, "action")
+        rewards = store.read_episode(episode_id, "reward")
+        plot_trajectory(states, actions, rewards, max_points=max_points)
+        plot_path(states, interactive=False, max_points=max_points)
 
     # ipdb.set_trace()  # Set a breakpoint for debugging
-    learning = pl.read_csv("training_logs/ppo_log.csv.monitor.csv", skip_rows=1)
-    figure, ax = plt.subplots(figsize=(10, 5))
-    # get smoothed rewards
-    smoothed_rewards = learning["r"].rolling_mean(100)
-    ax.plot(learning["episode_count"], learning["r"], label="Total Reward", color="black")
-    ax.plot(learning["episode_count"], smoothed_rewards, label="Smoothed Total Reward", color="blue")
-    ax.set_xlabel("Episode Count")
-    ax.set_ylabel("Total Reward")
-    ax.set_title("Learning Progress")
-    ax.legend()
-    figure.savefig("plots/learning_progress.png")
+    # only the episodes logged since the last run are parsed, see utils/learning_curves.py
+    from utils.learning_curves import LearningCurveIndex
+
+    learning = LearningCurveIndex()
+    learning.update()
+    learning.plot(os.path.join(args.out_dir, "learning_progress.png"))
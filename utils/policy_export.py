@@ -0,0 +1,111 @@
+import os
+import pickle
+import sys
+
+import numpy as np
+
+ACTIVATION_NAMES = ("Tanh", "ReLU")
+
+
+def export_policy(model_path, normalize_path, out_path):
+    """Write a trained `best_model.zip` and its `_normalize.pkl` statistics into one `.npz` artifact.
+
+    Only the parts needed for the deterministic action are kept: the observation statistics,
+    the Linear layers of `mlp_extractor.policy_net` with their activations, the `action_net`
+    head and the action space bounds. Load it with `utils.policy_runtime.NumpyPolicy`.
+
+    Args:
+        model_path (str): Saved PPO model (`best_model.zip`).
+        normalize_path (str): Saved `VecNormalize` statistics, None for a model trained without them.
+        out_path (str): Output `.npz` file.
+    """
+    import torch.nn as nn
+    from stable_baselines3 import PPO
+    from stable_baselines3.common.torch_layers import FlattenExtractor
+
+    model = PPO.load(model_path, device="cpu")
+    policy = model.policy
+    if not isinstance(policy.features_extractor, FlattenExtractor):
+        raise ValueError(f"Only MlpPolicy with a flatten extractor can be exported, got {policy.features_extractor}")
+
+    weights, biases, activations = [], [], []
+    for module in policy.mlp_extractor.policy_net:
+        if isinstance(module, nn.Linear):
+            weights.append(module.weight.detach().numpy())
+            biases.append(module.bias.detach().numpy())
+            activations.append("Identity")
+        elif type(module).__name__ in ACTIVATION_NAMES and activations:
+            activations[-1] = type(module).__name__
+        else:
+            raise ValueError(f"Cannot export policy layer {module}")
+    weights.append(policy.action_net.weight.detach().numpy())
+    biases.append(policy.action_net.bias.detach().numpy())
+    activations.append("Identity")
+
+    obs_dim = policy.observation_space.shape[0]
+    artifact = {
+        "norm_obs": False,
+        "obs_mean": np.zeros(obs_dim, dtype=np.float32),
+        "obs_var": np.ones(obs_dim, dtype=np.float32),
+        "epsilon": 1e-8,
+        "clip_obs": np.inf,
+    }
+    if normalize_path is not None:
+        with open(normalize_path, "rb") as f:
+            vecnorm = pickle.load(f)
+        artifact.update(
+            norm_obs=vecnorm.norm_obs,
+            obs_mean=vecnorm.obs_rms.mean.astype(np.float32),
+            obs_var=vecnorm.obs_rms.var.astype(np.float32),
+            epsilon=vecnorm.epsilon,
+            clip_obs=vecnorm.clip_obs,
+        )
+
+    np.savez(
+        out_path,
+        action_low=policy.action_space.low,
+        action_high=policy.action_space.high,
+        activations=np.array(activations),
+        **artifact,
+        **{f"weight_{i}": weight for i, weight in enumerate(weights)},
+        **{f"bias_{i}": bias for i, bias in enumerate(biases)},
+    )
+    return model
+
+
+def check_export(model, normalize_path, out_path, n=1000, seed=0):
+    """Largest absolute difference between the exported and the SB3 deterministic actions on random observations."""
+    from utils.policy_runtime import NumpyPolicy
+
+    observations = np.random.default_rng(seed).normal(0, 1000, (n, model.observation_space.shape[0])).astype(np.float32)
+    if normalize_path is not None:
+        # unpickled without an env, whose default observation may not match the model's channels
+        with open(normalize_path, "rb") as f:
+            vecnorm = pickle.load(f)
+        expected, _ = model.predict(vecnorm.normalize_obs(observations), deterministic=True)
+    else:
+        expected, _ = model.predict(observations, deterministic=True)
+    return float(np.abs(NumpyPolicy(out_path)(observations) - expected).max())
+
+
+if __name__ == "__main__":
+    import argparse
+
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+    parser = argparse.ArgumentParser(description="Export a trained PPO model to a numpy policy artifact.")
+    parser.add_argument("best_dir", help="model directory, e.g. 'models/million/a=0.0003, gamma=0.99_best'")
+    parser.add_argument("--out", default=None, help="output .npz, defaults to <best_dir>/policy.npz")
+    parser.add_argument("--check", action="store_true", help="compare the exported actions against SB3")
+    args = parser.parse_args()
+
+    best_dir = args.best_dir.rstrip("/")
+    normalize_path = f"{best_dir[: -len('_best')]}_normalize.pkl" if best_dir.endswith("_best") else None
+    if normalize_path is not None and not os.path.exists(normalize_path):
+        print(f"No {normalize_path}, exporting without observation normalization")
+        normalize_path = None
+    out = args.out or os.path.join(best_dir, "policy.npz")
+    model = export_policy(os.path.join(best_dir, "best_model.zip"), normalize_path, out)
+    print(f"Exported policy to {out}")
+    if args.check:
+        print(f"Max action difference to SB3: {check_export(model, normalize_path, out):.2e}")
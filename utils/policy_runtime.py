@@ -0,0 +1,42 @@
+import numpy as np
+
+ACTIVATIONS = {
+    "Tanh": np.tanh,
+    "ReLU": lambda x: np.maximum(x, 0.0),
+    "Identity": lambda x: x,
+}
+
+
+class NumpyPolicy:
+    """Deterministic PPO policy exported by `utils.policy_export`, run with numpy only.
+
+    The artifact holds the `VecNormalize` observation statistics and the weights of the policy
+    MLP and action head, so a call normalizes and clips the observation exactly like
+    `VecNormalize.normalize_obs`, runs the MLP, and clips the mean action to the action space
+    like `PPO.predict(deterministic=True)`. Neither torch nor Stable-Baselines3 is imported.
+
+    Args:
+        path (str): `.npz` artifact written by `export_policy`.
+    """
+
+    def __init__(self, path):
+        with np.load(path, allow_pickle=False) as artifact:
+            self.obs_mean = artifact["obs_mean"]
+            self.obs_scale = 1.0 / np.sqrt(artifact["obs_var"] + float(artifact["epsilon"]))
+            self.clip_obs = float(artifact["clip_obs"])
+            self.normalize = bool(artifact["norm_obs"])
+            self.action_low = artifact["action_low"]
+            self.action_high = artifact["action_high"]
+            activations = [str(name) for name in artifact["activations"]]
+            n_layers = len(activations)
+            self.layers = [(artifact[f"weight_{i}"].T.copy(), artifact[f"bias_{i}"]) for i in range(n_layers)]
+            self.activations = [ACTIVATIONS[name] for name in activations]
+
+    def __call__(self, observation):
+        """Action for one observation (obs_dim,) or a batch (n, obs_dim)."""
+        x = np.asarray(observation, dtype=np.float32)
+        if self.normalize:
+            x = np.clip((x - self.obs_mean) * self.obs_scale, -self.clip_obs, self.clip_obs)
+        for (weight, bias), activation in zip(self.layers, self.activations):
+            x = activation(x @ weight + bias)
+        return np.clip(x, self.action_low, self.action_high)
@@ -0,0 +1,46 @@
+from time import perf_counter
+
+STEP_PHASES = ("action", "physics", "state", "reward", "logging", "recording", "done")
+PHASES = STEP_PHASES + ("reset",)
+
+
+class PhaseTimer:
+    """Accumulates wall clock time per phase of the env step loop.
+
+    `start` marks the beginning of a step (or reset) and every `lap(phase)` charges the time
+    since the previous mark to `phase`, so a step costs one `perf_counter` call per phase.
+    """
+
+    def __init__(self, phases=PHASES):
+        self.totals = dict.fromkeys(phases, 0.0)
+        self.counts = dict.fromkeys(phases, 0)
+        self._mark = 0.0
+
+    def start(self):
+        self._mark = perf_counter()
+
+    def lap(self, phase):
+        now = perf_counter()
+        self.totals[phase] += now - self._mark
+        self.counts[phase] += 1
+        self._mark = now
+
+    def pop(self):
+        """Return the accumulated totals (s) and counts per phase and start a new aggregation window."""
+        timings = {"totals": dict(self.totals), "counts": dict(self.counts)}
+        self.totals = dict.fromkeys(self.totals, 0.0)
+        self.counts = dict.fromkeys(self.counts, 0)
+        return timings
+
+
+class NullTimer:
+    """Stand-in for `PhaseTimer` when profiling is off, every call is a no-op."""
+
+    def start(self):
+        pass
+
+    def lap(self, phase):
+        pass
+
+    def pop(self):
+        return {"totals": {}, "counts": {}}
@@ -0,0 +1,168 @@
+import glob
+import json
+import os
+
+import numpy as np
+from stable_baselines3.common.callbacks import BaseCallback
+
+PRUNED_MARKER = "PRUNED"
+
+
+class TrialReports:
+    """Intermediate evaluation rewards of every trial of a sweep, shared through the file system.
+
+    Each trial appends `{"step": ..., "value": ...}` lines to `<root>/<trial>.jsonl`, so trials
+    running concurrently in other processes, and trials finished in earlier sweeps, can be
+    compared without any coordination process. A trial trained again from the start `reset`s
+    its file first, the rewards of an interrupted attempt are not mixed into its reports.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def reset(self, trial):
+        path = os.path.join(self.root, f"{trial}.jsonl")
+        if os.path.exists(path):
+            os.remove(path)
+
+    def report(self, trial, step, value):
+        with open(os.path.join(self.root, f"{trial}.jsonl"), "a") as f:
+            f.write(json.dumps({"step": int(step), "value": float(value)}) + "\n")
+
+    def load(self):
+        """Map every trial to its (steps, values) arrays sorted by step."""
+        reports = {}
+        for path in glob.glob(os.path.join(self.root, "*.jsonl")):
+            steps, values = [], []
+            with open(path, "r") as f:
+                for line in f:
+                    if line.strip():
+                        entry = json.loads(line)
+                        steps.append(entry["step"])
+                        values.append(entry["value"])
+            order = np.argsort(steps, kind="stable")
+            reports[os.path.basename(path)[: -len(".jsonl")]] = (np.asarray(steps)[order], np.asarray(values)[order])
+        return reports
+
+
+def best_up_to(steps, values, step):
+    """Best value reported at or before `step`, None if the trial has not reached `step`."""
+    if len(steps) == 0 or steps[-1] < step:
+        return None
+    mask = steps <= step
+    return float(values[mask].max()) if mask.any() else None
+
+
+class MedianPruner:
+    """Prune a trial whose best reward so far is below the median of the other trials at the same step.
+
+    Args:
+        n_startup_trials (int): Other trials that must have reached the step before pruning.
+        n_warmup_steps (int): Never prune before this many env steps.
+    """
+
+    def __init__(self, n_startup_trials=2, n_warmup_steps=100_000):
+        self.n_startup_trials = n_startup_trials
+        self.n_warmup_steps = n_warmup_steps
+
+    def should_prune(self, trial, step, reports):
+        if step < self.n_warmup_steps or trial not in reports:
+            return False
+        current = best_up_to(*reports[trial], step)
+        others = [best_up_to(steps, values, step) for name, (steps, values) in reports.items() if name != trial]
+        others = [value for value in others if value is not None]
+        if current is None or len(others) < self.n_startup_trials:
+            return False
+        return current < float(np.median(others))
+
+
+class SuccessiveHalvingPruner:
+    """Asynchronous successive halving: at each rung only the top 1 / `reduction_factor` trials continue.
+
+    Rungs are at `min_resource * reduction_factor**k` env steps. A trial reaching a rung is
+    compared against every trial that reached it before, and is stopped unless its best reward
+    so far ranks in the top `max(1, n // reduction_factor)` of the `n` trials at the rung.
+
+    Args:
+        min_resource (int): Env steps of the first rung.
+        reduction_factor (int): Fraction of trials kept per rung is 1 / reduction_factor.
+    """
+
+    def __init__(self, min_resource=100_000, reduction_factor=3):
+        self.min_resource = min_resource
+        self.reduction_factor = reduction_factor
+
+    def rung_step(self, step):
+        """Step of the highest rung reached at `step`, None before the first rung."""
+        if step < self.min_resource:
+            return None
+        k = int(np.floor(np.log(step / self.min_resource) / np.log(self.reduction_factor) + 1e-9))
+        return self.min_resource * self.reduction_factor**k
+
+    def should_prune(self, trial, step, reports):
+        rung = self.rung_step(step)
+        if rung is None or trial not in reports:
+            return False
+        values = {name: best_up_to(steps, vals, rung) for name, (steps, vals) in reports.items()}
+        values = {name: value for name, value in values.items() if value is not None}
+        if trial not in values or len(values) < self.reduction_factor:
+            return False
+        n_keep = max(1, len(values) // self.reduction_factor)
+        ranked = sorted(values.values(), reverse=True)
+        return values[trial] < ranked[n_keep - 1]
+
+
+PRUNERS = {"median": MedianPruner, "halving": SuccessiveHalvingPruner}
+PRUNE_WARMUP = 0.25  # fraction of the training steps before the first pruning decision
+
+
+def make_pruner(name, total_timesteps, warmup=PRUNE_WARMUP):
+    """Pruner `name` whose warmup (median) or first rung (halving) is `warmup * total_timesteps` env steps.
+
+    Fixed step defaults equal to the length of a short run would only allow pruning at its final
+    evaluation, when there is no compute left to save.
+    """
+    start = max(int(warmup * total_timesteps), 1)
+    if name == "median":
+        return MedianPruner(n_warmup_steps=start)
+    if name == "halving":
+        return SuccessiveHalvingPruner(min_resource=start)
+    raise ValueError(f"Unknown pruner {name!r}, expected one of {sorted(PRUNERS)}")
+
+
+class PruningCallback(BaseCallback):
+    """Report every evaluation of an `EvalCallback` and stop training when the pruner says so.
+
+    Pass it as `EvalCallback(callback_after_eval=PruningCallback(...))`. When the trial is pruned
+    an empty `PRUNED` marker is written to `run_dir`, so the sweep can tell a pruned trial apart
+    from one that finished. The reports and marker of an earlier attempt of the trial are removed
+    when training starts.
+
+    Args:
+        trial (str): Name of the trial, the ppo subconfig.
+        reports (TrialReports): Shared reports of the sweep.
+        pruner: `MedianPruner` or `SuccessiveHalvingPruner`.
+        run_dir (str): Output directory of the trial.
+    """
+
+    def __init__(self, trial, reports, pruner, run_dir, verbose=0):
+        super().__init__(verbose)
+        self.trial = trial
+        self.reports = reports
+        self.pruner = pruner
+        self.run_dir = run_dir
+
+    def _on_training_start(self):
+        self.reports.reset(self.trial)
+        marker = os.path.join(self.run_dir, PRUNED_MARKER)
+        if os.path.exists(marker):
+            os.remove(marker)
+
+    def _on_step(self):
+        self.reports.report(self.trial, self.num_timesteps, self.parent.last_mean_reward)
+        if not self.pruner.should_prune(self.trial, self.num_timesteps, self.reports.load()):
+            return True
+        print(f"Pruning {self.trial} at {self.num_timesteps} steps (mean reward {self.parent.last_mean_reward:.2f})")
+        open(os.path.join(self.run_dir, PRUNED_MARKER), "w").close()
+        return False
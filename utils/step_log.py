@@ -0,0 +1,118 @@
+import os
+import queue
+import threading
+from datetime import datetime
+
+import numpy as np
+
+STEP_LOG_DIR = "logs/step_logs"
+
+
+class AsyncStepLog:
+    """Per step records written as Arrow IPC record batches by a background thread.
+
+    `log` copies one row into a preallocated float32 batch, a full batch is handed to the
+    writer thread through a queue of at most `max_pending` batches. When the writer falls
+    behind the batch is dropped (counted in `dropped_rows`) rather than blocking the caller, so
+    the memory held is bounded by `(max_pending + 1) * batch_rows` rows. The file is an Arrow
+    stream, readable with `polars.read_ipc_stream` up to the last written batch even when the
+    process dies before `close`. When the writer fails (e.g. a full disk) the error is kept in
+    `error` and raised by the next `flush` (so by `log`) and by `close`.
+
+    Args:
+        path (str): Output `.arrow` file.
+        columns (tuple): Column names, every row has one float32 value per column.
+        batch_rows (int): Rows per record batch.
+        max_pending (int): Batches queued for the writer before new ones are dropped.
+    """
+
+    def __init__(self, path, columns, batch_rows=1024, max_pending=16):
+        self.path = path
+        self.columns = tuple(columns)
+        self.batch_rows = batch_rows
+        self.written_rows = 0
+        self.dropped_rows = 0
+        self.error = None
+        self._batch = np.empty((batch_rows, len(self.columns)), dtype=np.float32)
+        self._size = 0
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._thread = threading.Thread(target=self._write_loop, name="step-log", daemon=True)
+        self._thread.start()
+
+    def log(self, *parts):
+        """Log one row made of the scalars and 1d arrays `parts`, in column order."""
+        row = self._batch[self._size]
+        offset = 0
+        for part in parts:
+            if np.ndim(part):
+                row[offset : offset + len(part)] = part
+                offset += len(part)
+            else:
+                row[offset] = part
+                offset += 1
+        self._size += 1
+        if self._size == self.batch_rows:
+            self.flush()
+
+    def flush(self):
+        """Hand the rows logged so far to the writer thread, e.g. at the end of an episode."""
+        self._raise_error()
+        if self._size == 0:
+            return
+        try:
+            self._queue.put_nowait(self._batch[: self._size])
+        except queue.Full:
+            self.dropped_rows += self._size
+            self._size = 0
+            return
+        # the queued batch now belongs to the writer
+        self._batch = np.empty_like(self._batch)
+        self._size = 0
+
+    def close(self):
+        """Write the pending rows, stop the writer thread and raise the error it failed with, if any."""
+        if self.error is None:
+            self.flush()
+        # a dead writer no longer drains the queue, a blocking put could wait forever
+        while self._thread.is_alive():
+            try:
+                self._queue.put(None, timeout=0.1)
+                break
+            except queue.Full:
+                pass
+        self._thread.join()
+        self._raise_error()
+
+    def _raise_error(self):
+        if self.error is not None:
+            raise RuntimeError(f"Step log writer of {self.path} failed") from self.error
+
+    def _write_loop(self):
+        import pyarrow as pa
+
+        sink = writer = None
+        try:
+            while True:
+                batch = self._queue.get()
+                if batch is None:
+                    break
+                if writer is None:
+                    os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+                    schema = pa.schema([(column, pa.float32()) for column in self.columns])
+                    sink = pa.OSFile(self.path, "wb")
+                    writer = pa.ipc.new_stream(sink, schema)
+                arrays = [pa.array(batch[:, i]) for i in range(len(self.columns))]
+                writer.write_batch(pa.RecordBatch.from_arrays(arrays, names=list(self.columns)))
+                self.written_rows += len(batch)
+            if writer is not None:
+                writer.close()
+                sink.close()
+        except Exception as error:
+            self.error = error
+            if sink is not None:
+                sink.close()
+
+
+def step_log_path(prefix, root=STEP_LOG_DIR):
+    """Unique `<root>/<prefix>_<pid>_<timestamp>.arrow` path for the step log of one env."""
+    return os.path.join(root, f"{prefix}_{os.getpid()}_{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}.arrow")
@@ -0,0 +1,28 @@
+import polars as pl
+
+from environment.fdm import EARTH_RADIUS, UNIT_CONVERSIONS
+
+DERIVED_COLUMNS = tuple(UNIT_CONVERSIONS) + ("x", "y")
+
+
+def derive_states(states):
+    """Add the derived quantities to recorded raw states, vectorized over the whole trajectory.
+
+    Adds the ft/deg conversions of `UNIT_CONVERSIONS` and the local `x`/`y` position (ft) from
+    the geodetic latitude/longitude. Works on a DataFrame of one episode as well as on a
+    LazyFrame scanned across episodes (`TrajectoryStore.scan`). States recorded before the
+    raw layout already carry these columns and are returned unchanged.
+
+    Args:
+        states (pl.DataFrame or pl.LazyFrame): Columns as `environment.fdm.STATE_KEYS`.
+    """
+    columns = states.collect_schema().names() if isinstance(states, pl.LazyFrame) else states.columns
+    if "x" in columns:
+        return states
+    lat = pl.col("lat-gc-rad")
+    lon = pl.col("long-gc-rad")
+    return states.with_columns(
+        *((pl.col(raw) * scale).alias(name) for name, (raw, scale) in UNIT_CONVERSIONS.items()),
+        (EARTH_RADIUS * lon * (lat / 2).radians().cos()).alias("x"),
+        (EARTH_RADIUS * lat).alias("y"),
+    )
@@ -0,0 +1,128 @@
+import json
+import os
+from datetime import datetime
+
+# pyarrow and polars are imported where they are used: env workers that never record an
+# episode should not pay for them at startup
+
+TRAJECTORY_DIR = "logs/trajectories"
+INDEX_FILE = "index.jsonl"
+
+
+class EpisodeWriter:
+    """Streams the tables of one episode into Arrow IPC files, one record batch per `write` call.
+
+    Args:
+        path (str): Directory of the episode.
+        tables (dict): Maps a table name (e.g. "state") to its column names.
+    """
+
+    def __init__(self, path, tables):
+        import pyarrow as pa
+
+        self.path = path
+        self.tables = {name: tuple(columns) for name, columns in tables.items()}
+        self.n_rows = {name: 0 for name in tables}
+        os.makedirs(path, exist_ok=True)
+        self._sinks = {}
+        self._writers = {}
+        for name, columns in self.tables.items():
+            schema = pa.schema([(column, pa.float64()) for column in columns])
+            self._sinks[name] = pa.OSFile(os.path.join(path, f"{name}.arrow"), "wb")
+            self._writers[name] = pa.ipc.new_file(self._sinks[name], schema)
+
+    def write(self, name, rows):
+        """Append the (n_rows, n_columns) array `rows` to table `name` as one record batch."""
+        import pyarrow as pa
+
+        if len(rows) == 0:
+            return
+        columns = self.tables[name]
+        batch = pa.RecordBatch.from_arrays([pa.array(rows[:, i]) for i in range(len(columns))], names=list(columns))
+        self._writers[name].write_batch(batch)
+        self.n_rows[name] += len(rows)
+
+    def close(self):
+        for name in self.tables:
+            self._writers[name].close()
+            self._sinks[name].close()
+
+
+class TrajectoryStore:
+    """Episode trajectories stored as uncompressed Arrow IPC files with an index across episodes.
+
+    Every episode lives in `<root>/<episode_id>/<table>.arrow`. Closing an episode appends one
+    json line with its summary to `<root>/index.jsonl`, which is safe for several workers
+    writing to the same root. Reads are memory mapped and column selective, so loading
+    `time`/`altitude` of thousands of episodes only touches those columns.
+
+    Args:
+        root (str): Directory of the store.
+    """
+
+    def __init__(self, root=TRAJECTORY_DIR):
+        self.root = root
+
+    def episode_path(self, episode_id):
+        return os.path.join(self.root, str(episode_id))
+
+    def open_episode(self, episode_id, tables):
+        """Start streaming a new episode, returns its `EpisodeWriter`."""
+        return EpisodeWriter(self.episode_path(episode_id), tables)
+
+    def close_episode(self, episode_id, writer, **summary):
+        """Close `writer` and register the episode in the index with the extra `summary` fields."""
+        writer.close()
+        entry = {
+            "episode_id": str(episode_id),
+            "n_steps": max(writer.n_rows.values(), default=0),
+            "tables": sorted(writer.tables),
+            "closed": datetime.now().isoformat(timespec="seconds"),
+            **summary,
+        }
+        # a single short write in append mode, so concurrent workers do not interleave lines
+        with open(os.path.join(self.root, INDEX_FILE), "a") as f:
+            f.write(json.dumps(entry) + "\n")
+
+    def index(self):
+        """Summaries of every closed episode as a polars DataFrame, in closing order."""
+        import polars as pl
+
+        path = os.path.join(self.root, INDEX_FILE)
+        if not os.path.exists(path) or os.path.getsize(path) == 0:
+            return pl.DataFrame()
+        return pl.read_ndjson(path)
+
+    def read_episode(self, episode_id, table="state", columns=None):
+        """Memory map one table of one episode, only materializing `columns` if given."""
+        import polars as pl
+
+        return pl.read_ipc(
+            os.path.join(self.episode_path(episode_id), f"{table}.arrow"), columns=columns, memory_map=True
+        )
+
+    def scan(self, table="state", columns=None, episode_ids=None):
+        """Lazily concatenate a table across episodes with an `episode_id` column.
+
+        Args:
+            table (str): Table to read, "state", "action" or "reward".
+            columns (list, optional): Columns to read, all columns when None.
+            episode_ids (list, optional): Episodes to read, every indexed episode when None.
+
+        Returns:
+            pl.LazyFrame: Call `.collect()` to materialize.
+        """
+        import polars as pl
+
+        if episode_ids is None:
+            index = self.index()
+            episode_ids = index["episode_id"].to_list() if len(index) else []
+        frames = []
+        for episode_id in episode_ids:
+            frame = pl.scan_ipc(os.path.join(self.episode_path(episode_id), f"{table}.arrow"), memory_map=True)
+            if columns is not None:
+                frame = frame.select(columns)
+            frames.append(frame.with_columns(pl.lit(str(episode_id)).alias("episode_id")))
+        if not frames:
+            return pl.LazyFrame()
+        return pl.concat(frames)